@@ -0,0 +1,177 @@
+import tinyparser
+import tinyparser.language as language
+import argparse, json, math, sys, time, tracemalloc
+
+# Generated inputs per language: name -> function(size) returning the text to parse
+inputs = {
+    "cpp": {
+        "statements": lambda size: "\n".join("a%d + b * (c - %d) / x++;" % (i, i) for i in range(size))
+        , "blocks": lambda size: "{" * size + "a;" + "}" * size
+        , "parentheses": lambda size: "(" * size + "1" + ")" * size + ";"
+        , "operators": lambda size: " + ".join("-a%d * %d" % (i, i) for i in range(size)) + ";"
+    }
+    , "json": {
+        "array": lambda size: "[" + ", ".join("%d.5" % (i + 1) for i in range(size)) + "]"
+        , "object": lambda size: "{" + ", ".join('"key%d": "value %d"' % (i, i) for i in range(size)) + "}"
+        , "records": lambda size: "[" + ",\n".join('{"id": %d, "tags": ["a", "b"], "nested": {"ok": 1}}' % i for i in range(size)) + "]"
+        , "nesting": lambda size: "[" * size + "1" + "]" * size
+    }
+    , "regex": {
+        "alternatives": lambda size: "|".join("ab[c-e]{2,3}x*" for i in range(size))
+        , "groups": lambda size: "(" * size + "a" + ")" * size
+        , "classes": lambda size: "".join("[A-Za-z0-9._%%+]{%d,}" % i for i in range(size))
+    }
+}
+
+# Returns the fastest of "repeat" runs of "function" in seconds, together with its last result
+# "function" gets the arguments returned by "prepare" (called before each run, untimed), if given
+def measure_time(function, repeat, prepare=None):
+    best, result = None, None
+    for _ in range(repeat):
+        result = None # Free the previous result first
+        arguments = prepare() if prepare else ()
+        start = time.perf_counter()
+        result = function(*arguments)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+# Returns the peak memory in bytes while running "function" and the number of memory blocks that are still allocated
+# afterwards (net of the blocks freed again, i.e. those its result holds)
+def measure_memory(function, prepare=None):
+    arguments = prepare() if prepare else ()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = function(*arguments)
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(statistic.count_diff for statistic in after.compare_to(before, "filename"))
+    del result
+    return peak, blocks
+
+# Returns the most tokens the token buffer held, whenever it read the next chunk of "text" while parsing it (only
+# reporting events, as results with "input_tokens" keep their tokens anyway)
+def measure_retention(lang, text, chunk_size=4096):
+    held = []
+    def chunks():
+        for start in range(0, len(text), chunk_size):
+            held.append(len(tokens.type_ids))
+            yield text[start:start + chunk_size]
+    tokens, cache, profiler = tinyparser.open_input(lang, chunks())
+    if tinyparser.parse_tokens(lang, tokens, cache, events=True) is None:
+        raise Exception("The input did not match the grammar.")
+    return max(held)
+
+# Measures tokenizing and parsing one input, separately
+def run(lang, language_name, input_name, engine, size, repeat):
+    text = inputs[language_name][input_name](size)
+    record = {
+        "language": language_name, "input": input_name, "size": size, "characters": len(text)
+        , "engine": engine, "packrat": bool(lang.packrat)
+    }
+    try:
+        tokenize = lambda: tinyparser.tokenize(lang, text)
+        elapsed, tokens = measure_time(tokenize, repeat)
+        record["tokens"] = len(tokens)
+        peak, blocks = measure_memory(tokenize)
+        record["tokenize"] = {
+            "time": elapsed, "tokens_per_second": len(tokens) / elapsed if elapsed else None
+            , "peak_memory": peak, "retained_blocks": blocks
+        }
+
+        # Parsed like "parse" does: from a token store filled up front, with a new packrat cache, if the language enables it
+        prepare = lambda: tinyparser.open_input(lang, text)[:2]
+        parse = lambda token_store, cache: tinyparser.parse_tokens(lang, token_store, cache)
+        elapsed, result = measure_time(parse, repeat, prepare)
+        if result is None:
+            raise Exception("The input did not match the grammar.")
+        peak, blocks = measure_memory(parse, prepare)
+        record["parse"] = {
+            "time": elapsed, "tokens_per_second": len(tokens) / elapsed if elapsed else None
+            , "peak_memory": peak, "retained_blocks": blocks
+        }
+        record["events_retained_tokens"] = measure_retention(lang, text) # Only measured with "parse_events"
+    except (Exception, RecursionError) as error:
+        record["error"] = "%s: %s" % (type(error).__name__, error)
+    return record
+
+# Adds the growth exponent of time over tokens compared to the previous size of the same series
+# (1 means linear scaling, 2 quadratic, etc.)
+def add_scaling(records):
+    previous = {}
+    for record in records:
+        series = (record["language"], record["input"], record["engine"], record["packrat"])
+        last = previous.get(series, None)
+        if "error" not in record:
+            if last is not None and record["tokens"] > last["tokens"]:
+                ratio = math.log(record["tokens"] / last["tokens"])
+                for phase in ("tokenize", "parse"):
+                    if record[phase]["time"] and last[phase]["time"]:
+                        record[phase]["scaling"] = math.log(record[phase]["time"] / last[phase]["time"]) / ratio
+            previous[series] = record
+    return records
+
+# Prints the relative change of times and memory compared to the records of an earlier run
+def compare(records, baseline_file, file):
+    def key(record):
+        return record["language"], record["input"], record["size"], record["engine"], record["packrat"]
+    with open(baseline_file) as baseline:
+        baseline = {key(record): record for record in map(json.loads, baseline) if "error" not in record}
+    for record in records:
+        old = baseline.get(key(record), None)
+        if old is None or "error" in record:
+            continue
+        changes = []
+        for phase in ("tokenize", "parse"):
+            for metric in ("time", "peak_memory"):
+                if old[phase][metric]:
+                    changes.append("%s %s %+.1f%%" % (phase, metric, (record[phase][metric] / old[phase][metric] - 1) * 100))
+        file.write("%s/%s (%s) size %d: %s\n" % (record["language"], record["input"], record["engine"], record["size"], ", ".join(changes)))
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark tokenizing and parsing of the bundled languages.")
+    parser.add_argument("--languages", default="cpp,json,regex", help="comma separated languages to benchmark")
+    parser.add_argument("--inputs", default=None, help="comma separated input names (default: all)")
+    parser.add_argument("--sizes", default="10,100,300,1000", help="comma separated input sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs (the fastest counts)")
+    parser.add_argument("--engines", default="recursive,iterative", help="comma separated parse engines (recursive, iterative, codegen)")
+    parser.add_argument("--packrat", action="store_true", help="parse with packrat memoization (a new cache per run)")
+    parser.add_argument("--output", default=None, help="write JSON lines to this file instead of stdout")
+    parser.add_argument("--compare", default=None, help="JSON lines of an earlier run to compare with (written to stderr)")
+    parser.add_argument("--max-retained", type=int, default=None, help="fail, if parsing a streamed input for events held more tokens at once")
+    arguments = parser.parse_args(arguments)
+
+    records = []
+    for language_name in arguments.languages.split(","):
+        lang = getattr(language, language_name)
+        lang.packrat = arguments.packrat
+        for input_name in inputs[language_name]:
+            if arguments.inputs and input_name not in arguments.inputs.split(","):
+                continue
+            for engine in arguments.engines.split(","):
+                lang.iterative, lang.codegen = engine == "iterative", engine == "codegen"
+                for size in map(int, arguments.sizes.split(",")):
+                    records.append(run(lang, language_name, input_name, engine, size, arguments.repeat))
+                    sys.stderr.write("%s/%s (%s) size %d done\n" % (language_name, input_name, engine, size))
+    add_scaling(records)
+
+    file = open(arguments.output, "w") if arguments.output else sys.stdout
+    for record in records:
+        file.write(json.dumps(record) + "\n")
+    if arguments.output:
+        file.close()
+    if arguments.compare:
+        compare(records, arguments.compare, sys.stderr)
+    if arguments.max_retained is not None:
+        exceeded = [record for record in records if record.get("events_retained_tokens", 0) > arguments.max_retained]
+        for record in exceeded:
+            sys.stderr.write("%s/%s (%s) size %d held %d tokens\n" % (record["language"], record["input"], record["engine"], record["size"], record["events_retained_tokens"]))
+        if exceeded:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+import asyncio
+import copy
+import gc
+import io
+import pickle
+import pytest
+import sys
+import threading
+import tinyparser
+import tinyparser.codegen as codegen
+import tinyparser.incremental as incremental
+import tinyparser.language as language
+import weakref
+from tinyparser import Token, Language, AST
+
+@pytest.fixture(params=[False, True], ids=["recursive", "iterative"])
+def iterative(request):
+    return request.param
+
+# Statements starting with keywords, which are identifiers as well
+keyword_rules = {
+    "0.1": ( AST , Token.exactly("while") , Token.LEFT_PARENTHESIS , (Token.IDENTIFIER, "condition") , Token.RIGHT_PARENTHESIS , Token.SEMICOLON ),
+    "0.2": ( AST , Token.exactly("if") , Token.LEFT_PARENTHESIS , (Token.IDENTIFIER, "condition") , Token.RIGHT_PARENTHESIS , Token.SEMICOLON ),
+    "0.3": ( AST , (Token.IDENTIFIER, "name") , Token.SEMICOLON ),
+}
+
+def test_keyword_statement(iterative):
+    result = tinyparser.parse(Language(keyword_rules, Token, "0.", iterative=iterative), "while (a);")
+    assert result.condition.value == "a"
+
+# After the keyword statement failed at its second step, the identifier statement starts at the keyword again
+@pytest.mark.parametrize("text", ["while;", "if;"])
+def test_alternative_after_failed_step(text, iterative):
+    result = tinyparser.parse(Language(keyword_rules, Token, "0.", iterative=iterative), text)
+    assert result is not None and result.name.value == text[:-1]
+
+# A shorter alternative doesn't take over the steps a longer one matched before it failed
+@pytest.mark.parametrize("language_name, text", [("cpp", "a+;"), ("json", "[1,]"), ("json", '{"a":1,}')])
+def test_incomplete_input(language_name, text, iterative):
+    grammar = getattr(language, language_name)
+    assert tinyparser.parse(Language(grammar.rules, grammar.token_class, grammar.root_rule, iterative=iterative), text) is None
+
+# Rules are compiled on the first use only, indexed by their paths in order, and compiled again on request
+def test_compiled_rules():
+    grammar = Language(dict(keyword_rules), Token, "0.")
+    assert tinyparser.parse(grammar, "a;") is not None
+    compiled = grammar.compiled_rules
+    assert [rule.key for rule in grammar.lookup("0.")] == ["0.1", "0.2", "0.3"]
+    assert [rule.key for rule in grammar.lookup("0.2")] == ["0.2"]
+    assert tinyparser.parse(grammar, "if (b);").condition.value == "b"
+    assert grammar.compiled_rules is compiled
+
+    grammar.rules["0.4"] = ( AST , (Token.NUMBER, "number") , Token.SEMICOLON )
+    assert tinyparser.parse(grammar.compile(), "1;").number.value == "1"
+    assert [rule.key for rule in grammar.lookup("0.")] == ["0.1", "0.2", "0.3", "0.4"]
+
+# Rules starting with keywords are only attempted at their keywords, which gives the same results as attempting all
+# rules, from a token store as well as from a list of tokens
+keyword_count_rules = {
+    **{"0.%d" % number: ( AST , Token.exactly("k%d" % number) , (Token.IDENTIFIER, "name") , Token.SEMICOLON ) for number in range(1, 101)},
+    "0.101": ( AST , (Token.IDENTIFIER, "name") , Token.SEMICOLON ),
+    "0.102": ( AST , Token.LEFT_CURLY_BRACKET , ("0.", "inner") , Token.RIGHT_CURLY_BRACKET ),
+}
+
+def test_literal_dispatch(iterative, monkeypatch):
+    grammar = Language(keyword_count_rules, Token, "0.", iterative=iterative)
+    literal = Token.exactly("k57")
+    assert (literal.type, literal.value) == (Token.IDENTIFIER, "k57")
+    assert [rule.key for rule in grammar.candidates("0.", tinyparser.TokenBuffer(tinyparser.tokenize(grammar, "k57 a;")), 0)] == ["0.57", "0.101"]
+    assert [rule.key for rule in grammar.candidates("0.", tinyparser.TokenBuffer(tinyparser.tokenize(grammar, "{x;}")), 0)] == ["0.102"]
+
+    texts = ["k57 a;", "{k100 k1;}", "k1;", "x;", "k2 b c;"]
+    results = [tinyparser.parse(grammar, text) for text in texts]
+    assert results[0].name.value == "a" and results[1].inner.name.value == "k1" and results[2].name.value == "k1" and results[4] is None
+    assert [dump(tinyparser.parse_tokens(grammar, tinyparser.tokenize(grammar, text))) for text in texts] == list(map(dump, results))
+    with monkeypatch.context() as patch:
+        patch.setattr(Language, "candidates", lambda self, rule_path, token_list, index: self.lookup(rule_path))
+        assert [dump(tinyparser.parse(grammar, text)) for text in texts] == list(map(dump, results))
+
+# The second statement reuses the memoized sum the first one matched before it failed
+backtracking_rules = {
+    "0.1": ( AST , ("1.", "value") , Token.SEMICOLON ),
+    "0.2": ( AST , ("2.", "value") , Token.COMMA ),
+    "2.1": ( AST , ("1.", "sum") ),
+    "1.1": ( AST , (Token.IDENTIFIER, "name") , Token.PLUS , ("1.", "right") ),
+    "1.2": ( AST , (Token.IDENTIFIER, "name") ),
+}
+
+def test_packrat_cache(iterative):
+    grammar = Language(backtracking_rules, Token, "0.", iterative=iterative)
+    cache = tinyparser.PackratCache()
+    result = tinyparser.parse(grammar, "a + b + c,", cache)
+    assert result.value.sum.right.right.name.value == "c"
+    assert cache.hits > 0 and len(cache) == 0 # Dropped after parsing
+    assert dump(result) == dump(tinyparser.parse(Language(backtracking_rules, Token, "0.", iterative=iterative, packrat=2), "a + b + c,"))
+
+def test_packrat_cache_eviction():
+    cache = tinyparser.PackratCache(2)
+    cache.put("a", 0, "x", True, 1)
+    cache.put("b", 0, "y", True, 1)
+    assert cache.get("a", 0) == ("x", True, 1)
+    cache.put("c", 0, "z", True, 1) # Evicts "b", which was used least recently
+    assert cache.get("b", 0) is None and cache.get("a", 0) is not None and cache.get("c", 0) is not None
+    assert (cache.hits, cache.misses, len(cache)) == (3, 1, 2)
+
+# The profiler counts the attempts of the rules that can start with the current token, and the tokens of each type
+def test_profiler(iterative):
+    profiler = tinyparser.Profiler()
+    assert tinyparser.parse(Language(keyword_rules, Token, "0.", iterative=iterative), "if;", profiler=profiler) is not None
+    counts = profiler.as_dict()
+    assert {key: (rule["attempts"], rule["successes"], rule["failures"], rule["consumed_tokens"]) for key, rule in counts["rules"].items()} == {
+        "0.2": (1, 0, 1, 0), "0.3": (1, 1, 0, 2)
+    }
+    assert {name: token["count"] for name, token in counts["tokens"].items()} == {"IDENTIFIER": 1, "SEMICOLON": 1}
+
+    profiler.clear()
+    assert tinyparser.parse(Language(backtracking_rules, Token, "0.", iterative=iterative), "a + b;", profiler=profiler) is not None
+    file = io.StringIO()
+    profiler.write_collapsed(file)
+    stacks = [line.rsplit(" ", 1)[0] for line in file.getvalue().splitlines()]
+    assert "0.1;1.1;1.2" in stacks and "tokenize;PLUS" in stacks
+
+# Events are only reported for the rules of the match, not for the statement that was backtracked
+class RecordingHandler(tinyparser.EventHandler):
+    def __init__(self):
+        self.events = []
+    def enter(self, rule, target, start_token):
+        self.events.append(("enter", rule, start_token.value))
+    def token(self, token):
+        self.events.append(("token", token.value))
+    def exit(self, rule, end_token):
+        self.events.append(("exit", rule, end_token.value))
+
+@pytest.mark.parametrize("packrat", [False, True], ids=["plain", "packrat"])
+def test_parse_events(packrat, iterative):
+    grammar = Language(backtracking_rules, Token, "0.", packrat=packrat, iterative=iterative)
+    handler = RecordingHandler()
+    assert tinyparser.parse_events(grammar, "a + b,", handler)
+    assert handler.events == [
+        ("enter", "0.2", "a"), ("enter", "2.1", "a"), ("enter", "1.1", "a"), ("token", "a"), ("token", "+")
+        , ("enter", "1.2", "b"), ("token", "b"), ("exit", "1.2", "b"), ("exit", "1.1", "b"), ("exit", "2.1", "b")
+        , ("token", ","), ("exit", "0.2", ",")
+    ]
+    handler = RecordingHandler()
+    assert not tinyparser.parse_events(grammar, "a +", handler) and handler.events == []
+
+# Without packrat parsing, each level of parentheses parses the levels inside it twice
+exponential_rules = {
+    "0.1": ( AST , Token.LEFT_PARENTHESIS , "0." , Token.RIGHT_PARENTHESIS , Token.SEMICOLON ),
+    "0.2": ( AST , "1." , Token.COMMA ),
+    "0.3": ( AST , (Token.IDENTIFIER, "name") ),
+    "1.1": ( AST , Token.LEFT_PARENTHESIS , "0." , Token.RIGHT_PARENTHESIS ),
+}
+
+# The exception tells which limit was exceeded, the work done so far and the furthest token a rule was attempted at
+@pytest.mark.parametrize("limits, limit, attempts", [({"max_attempts": 1000}, "attempts", 1000), ({"timeout": 0}, "timeout", 256)])
+def test_parse_limit(limits, limit, attempts, iterative):
+    text = "(" * 20 + "a" + ")" * 20 + "."
+    with pytest.raises(tinyparser.ParseLimitExceeded) as raised:
+        tinyparser.parse(Language(exponential_rules, Token, "0.", iterative=iterative), text, **limits)
+    error = raised.value
+    assert (error.limit, error.attempts, error.index, error.token.value) == (limit, attempts, 20, "a")
+    assert 0 < error.backtracks < attempts and error.elapsed >= 0
+    assert (error.position.line, error.position.column) == (1, 21) and "line 1, column 21" in str(error)
+    copied = pickle.loads(pickle.dumps(error)) # E.g. raised in a "parse_many" worker
+    assert (copied.limit, copied.attempts, copied.backtracks, copied.index, copied.token.value, str(copied)) == (limit, attempts, error.backtracks, 20, "a", str(error))
+    assert tinyparser.parse(Language(exponential_rules, Token, "0.", iterative=iterative, packrat=True), text, max_attempts=1000) is None
+
+# Returns a copy of a bundled language with other options (compiled again on its first use)
+def with_options(grammar, **options):
+    derived = copy.copy(grammar)
+    for name, value in options.items():
+        setattr(derived, name, value)
+    return derived
+
+# Results are compared in the json format of "write_ast", as AST objects don't compare their attributes
+def dump(result):
+    file = io.StringIO()
+    tinyparser.write_ast(result, file, "json")
+    return file.getvalue()
+
+# Right recursive lists and dictionaries collect all their elements, also when packrat parsing backtracks into them
+@pytest.mark.parametrize("packrat", [False, True], ids=["plain", "packrat"])
+def test_chained_results(packrat, iterative):
+    grammar = with_options(language.json, packrat=packrat, iterative=iterative)
+    text = "[%s, {%s}]" % (", ".join(map(str, range(200))), ", ".join('"k%d": [%d]' % (number, number) for number in range(100)))
+    assert tinyparser.parse(grammar, text) == [*range(200), {"k%d" % number: [number] for number in range(100)}]
+    program = tinyparser.parse(with_options(language.cpp, packrat=packrat, iterative=iterative), "a; { b; c; } d;")
+    assert [type(statement).__name__ for statement in program.statements] == ["ExpressionStatement", "StatementBlock", "ExpressionStatement"]
+    assert len(program.statements[1].statements) == 2
+
+# The iterative engine builds the same results as the recursive one, also nested deeper than the recursion limit
+@pytest.mark.parametrize("language_name, text", [
+    ("cpp", '{ a+b*c; (1+"s")*-3; x++; }'), ("json", '{"a": [1, 2.5, "x", {}], "b": []}'), ("regex", "a|b(c+)*[x-z]{2}")
+])
+def test_iterative_engine(language_name, text):
+    grammar = getattr(language, language_name)
+    expected = tinyparser.parse(with_options(grammar, iterative=False), text)
+    assert expected is not None and dump(tinyparser.parse(with_options(grammar, iterative=True), text)) == dump(expected)
+
+def test_iterative_engine_depth():
+    depth = sys.getrecursionlimit() * 2
+    result = tinyparser.parse(with_options(language.json, iterative=True), '{"a": ' * depth + "1" + "}" * depth)
+    for _ in range(depth):
+        result = result["a"]
+    assert result == 1
+
+# The number of Python frames that can still be entered
+def free_frames():
+    def descend(depth):
+        try:
+            return descend(depth + 1)
+        except RecursionError:
+            return depth
+    return descend(0)
+
+# The recursive engine takes one Python frame per rule reference, with a packrat cache as well as without one, so it
+# parses inputs as deep as before memoization (992 list elements, 987 statements, 246 groups with 1000 frames)
+@pytest.mark.parametrize("language_name, text", [
+    ("json", "[%s]" % ", ".join(["1"] * 985)), ("cpp", "a; " * 985), ("regex", "(" * 240 + "a" + ")" * 240)
+], ids=["json", "cpp", "regex"])
+@pytest.mark.parametrize("packrat", [False, True], ids=["plain", "packrat"])
+def test_recursive_engine_depth(language_name, text, packrat):
+    grammar = with_options(getattr(language, language_name), packrat=packrat)
+    grammar.compile()
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(limit - free_frames() + 1000) # 1000 frames for parsing, as in a script
+    try:
+        assert tinyparser.parse(grammar, text) is not None
+    finally:
+        sys.setrecursionlimit(limit)
+
+# Results come back in input order, in the current process as well as from a pool, and exceptions take their place
+@pytest.mark.parametrize("workers", [0, 2])
+def test_parse_many(workers):
+    inputs = ['{"a": [1, 2]}', "[1,]", 42] + ["[%d]" % number for number in range(20)]
+    results = tinyparser.parse_many(language.json, inputs, workers, chunksize=3)
+    assert results[:2] == [{"a": [1, 2]}, None] and isinstance(results[2], TypeError)
+    assert results[3:] == [[number] for number in range(20)]
+    assert sorted(tinyparser.iparse_many(language.json, inputs[3:], workers)) == list(enumerate(results[3:]))
+
+# Asynchronous streams give the same results as strings, and their errors are raised by "parse_async"
+async def async_chunks(text, size=3, error=None):
+    for start in range(0, len(text), size):
+        await asyncio.sleep(0)
+        if error is not None and start >= len(text) // 2:
+            raise error
+        yield text[start:start + size]
+
+def test_parse_async():
+    text = '{"a": [1, 2.5, "xyz"], "b": {"c": 3}}'
+    async def parse_all():
+        reader = asyncio.StreamReader()
+        reader.feed_data(text.encode("utf-8"))
+        reader.feed_eof()
+        return [
+            await tinyparser.parse_async(language.json, async_chunks(text))
+            , await tinyparser.parse_async(language.json, reader, chunk_size=4)
+            , await tinyparser.parse_async(language.json, async_chunks("[1,]"))
+        ]
+    assert asyncio.run(parse_all()) == [tinyparser.parse(language.json, text)] * 2 + [None]
+    with pytest.raises(ValueError, match="broken"):
+        asyncio.run(tinyparser.parse_async(language.json, async_chunks(text, error=ValueError("broken"))))
+
+# Cancelling "parse_async" waits for its thread to stop, which it does at the next chunk of a stream that never ends
+def test_parse_async_cancel():
+    async def cancel():
+        waiting = asyncio.Event()
+        async def endless_chunks():
+            waiting.set() # Cancels while the thread is still busy with this chunk
+            yield "[" + "1, " * 100000
+            await asyncio.Event().wait()
+        parsing = asyncio.create_task(tinyparser.parse_async(language.json, endless_chunks()))
+        await waiting.wait()
+        parsing.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await parsing
+        return [thread for thread in threading.enumerate() if thread.name.startswith("tinyparser")]
+    assert asyncio.run(cancel()) == []
+
+# Results are reused for the same input and grammar, the least recently used ones are evicted by count or size
+def test_result_cache():
+    cache = tinyparser.ResultCache(maxsize=2)
+    grammar = with_options(language.json, result_cache=cache)
+    first = tinyparser.parse(grammar, "[1, 2]")
+    assert tinyparser.parse(grammar, "[1, 2]") == first and tinyparser.parse(grammar, "[1, 2]") is not first # Copies
+    tinyparser.parse(grammar, "[3]")
+    tinyparser.parse(grammar, "[1, 2]")
+    tinyparser.parse(grammar, "[4]") # Evicts "[3]"
+    assert (cache.hits, cache.misses, cache.evictions, len(cache)) == (3, 3, 1, 2)
+    tinyparser.parse(grammar, "[3]")
+    assert cache.misses == 4
+    assert tinyparser.parse(with_options(language.json, result_cache=cache), "[3]") == [3] and cache.misses == 5 # Another grammar object
+
+    cache = tinyparser.ResultCache(maxsize=None, maxbytes=1000)
+    grammar = with_options(language.json, result_cache=cache)
+    for number in range(10):
+        tinyparser.parse(grammar, '{"a": [%d, 2, 3]}' % number)
+    assert 0 < cache.bytes <= 1000 and cache.evictions == 10 - len(cache)
+
+# A language can be collected while results parsed with it are cached, these keep the objects their key refers to
+def test_result_cache_languages():
+    cache = tinyparser.ResultCache(maxsize=2)
+    grammar = with_options(language.json, result_cache=cache)
+    tinyparser.parse(grammar, "[1]")
+    collected = weakref.ref(grammar)
+    del grammar
+    gc.collect()
+    assert collected() is None and len(cache) == len(cache.referents) == 1
+    grammar = with_options(language.cpp, result_cache=cache)
+    tinyparser.parse(grammar, "a;")
+    tinyparser.parse(grammar, "b;") # Evicts the result of the collected language, along with the objects it kept
+    assert len(cache) == 2 and len(cache.referents) == 1
+
+def test_frozen_result_cache():
+    grammar = with_options(language.cpp, result_cache=tinyparser.ResultCache(mode="frozen"))
+    program = tinyparser.parse(grammar, "a + b; c;")
+    assert tinyparser.parse(grammar, "a + b; c;") is program
+    assert isinstance(program.statements, tuple) and len(program.statements) == 2
+    with pytest.raises(AttributeError, match="cached result"):
+        program.statements = []
+    token = program.statements[0].expression.type
+    assert token.value == "+"
+    with pytest.raises(AttributeError, match="cached result"):
+        token.value = "-"
+
+# Splitting a long repetition among workers gives the same result as parsing the whole input (compared in the text
+# format, as the elements have the tokens of their workers), and an element that doesn't match fails the whole input
+@pytest.mark.parametrize("workers", [0, 2])
+def test_parse_split(workers):
+    text = "[%s]" % ", ".join('{"id": %d, "tags": [1, "a"]}' % number for number in range(300))
+    assert tinyparser.parse_split(language.json, text, "1.1.", workers, chunk_tokens=200) == tinyparser.parse(language.json, text)
+    assert tinyparser.parse_split(language.json, "[1, 2, 3,]", "1.1.", workers, chunk_tokens=1) is None
+
+    text = "\n".join("a%d + b * (c - %d);" % (number, number) for number in range(300)) + " { x; y; }"
+    expected, result = io.StringIO(), io.StringIO()
+    tinyparser.write_ast(tinyparser.parse(language.cpp, text), expected)
+    tinyparser.write_ast(tinyparser.parse_split(language.cpp, text, "1.", workers, chunk_tokens=200), result)
+    assert result.getvalue() == expected.getvalue()
+
+# Results are loaded again from the json format with the same classes, tokens and shared token lists
+@pytest.mark.parametrize("language_name, text", [
+    ("cpp", "a + b * -c; { x++; }"), ("json", '{"a": [1, 2.5, "x", {"c": [3]}], "b": "y"}'), ("regex", "a|b(c+)*[x-z]{2}")
+])
+def test_ast_round_trip(language_name, text):
+    grammar = getattr(language, language_name)
+    result = tinyparser.parse(grammar, text)
+    assert result is not None
+    loaded = tinyparser.read_ast(io.StringIO(dump(result)), grammar)
+    assert dump(loaded) == dump(result)
+    expected, written = io.StringIO(), io.StringIO()
+    tinyparser.write_ast(result, expected)
+    tinyparser.write_ast(loaded, written)
+    assert written.getvalue() == expected.getvalue()
+    if language_name == "cpp": # Runs of tokens refer to the tokens loaded before
+        statement = loaded.statements[0]
+        assert statement.input_tokens[:-1] == statement.expression.input_tokens and statement.input_tokens[0] is statement.expression.left.input_tokens[0]
+
+def test_ast_depth():
+    depth = sys.getrecursionlimit() * 2
+    result = tinyparser.parse(with_options(language.json, iterative=True), '{"a": ' * depth + "[1]" + "}" * depth)
+    loaded = tinyparser.read_ast(io.StringIO(dump(result)), language.json)
+    for _ in range(depth):
+        loaded = loaded["a"]
+    assert loaded == [1]
+    with pytest.raises(TypeError):
+        dump({"a": object()})
+
+# Generated parsers accept and reject the same inputs as the interpreter and build the same results
+@pytest.mark.parametrize("language_name, text, accepted", [
+    ("cpp", "a+b*c;", True), ("cpp", "{ x++; -y; }", True), ("cpp", '(1+"s")*-3; a-b-c;', True)
+    , ("cpp", "a+;", False), ("cpp", "a b;", False), ("cpp", "{ a; ", False)
+    , ("json", '{"a": [1, 2.5, "x", {}], "b": []}', True), ("json", "[]", True), ("json", "[1,]", False), ("json", '{"a" 1}', False)
+    , ("regex", "a|b(c+)*[x-z]{2}", True), ("regex", "a{1,3}", True), ("regex", "(a", False), ("regex", "a|", False)
+])
+@pytest.mark.parametrize("packrat", [False, True], ids=["plain", "packrat"])
+def test_generated_parser(language_name, text, accepted, packrat, tmp_path):
+    grammar = getattr(language, language_name)
+    expected = tinyparser.parse(with_options(grammar, packrat=packrat), text)
+    result = tinyparser.parse(with_options(grammar, packrat=packrat, codegen=str(tmp_path)), text)
+    assert (expected is not None) == (result is not None) == accepted
+    assert dump(result) == dump(expected)
+
+# The generated module is written once per grammar and imported again afterwards, a changed grammar gets its own one
+def test_generated_parser_cache(tmp_path, monkeypatch):
+    assert tinyparser.parse(with_options(language.cpp, codegen=str(tmp_path)), "a+b;") is not None
+    files = list(tmp_path.glob("tinyparser_*.py"))
+    assert len(files) == 1
+
+    def source(generator):
+        raise AssertionError("The cached parser was generated again")
+    with monkeypatch.context() as patch:
+        patch.setattr(codegen.Generator, "source", source)
+        assert tinyparser.parse(with_options(language.cpp, codegen=str(tmp_path)), "a*b;") is not None
+
+    rules = {**language.cpp.rules, "24.4": ( AST , Token.LEFT_SQUARE_BRACKET , Token.RIGHT_SQUARE_BRACKET )}
+    changed = Language(rules, Token, "0.", codegen=str(tmp_path))
+    assert codegen.Generator(changed).fingerprint != codegen.Generator(language.cpp).fingerprint
+    assert tinyparser.parse(with_options(language.cpp, codegen=str(tmp_path)), "[];") is None
+    assert tinyparser.parse(changed, "[];") is not None
+    assert len(list(tmp_path.glob("tinyparser_*.py"))) == 2 and files[0].exists()
+
+# Reparsing after a small edit attempts as many rules in a long document as in a short one and builds the same result
+# as parsing the edited text (the levels of the statement list in front of the edit are only linked again)
+def test_reparse_attempts(iterative):
+    attempts = []
+    for count in (20, 60, 180):
+        text = "\n".join("a%d + b * (c - %d) / x++;" % (number, number) for number in range(count))
+        profiler = tinyparser.Profiler()
+        grammar = with_options(language.cpp, iterative=iterative, profiler=None)
+        document = tinyparser.parse_document(grammar, text)
+        position = text.index("b", len(text) // 2)
+        grammar.profiler = profiler
+        document = tinyparser.reparse(document, (position, position + 1, "q\n"))
+        attempts.append(sum(counts[0] for counts in profiler.rules.values()))
+        assert dump(document.result) == dump(tinyparser.parse(with_options(language.cpp, iterative=iterative), document.text))
+        last = document.tokens[-1]
+        assert (last.end.index, last.end.line) == (len(document.text) + 1, count + 1)
+    assert attempts[0] == attempts[1] == attempts[2] > 0
+
+# Reparsing a long list looks at as many cache entries as reparsing a short one, wherever the edit is (the levels of
+# the list in front of it end with the levels behind it, without being visited)
+def test_reparse_work(iterative, monkeypatch):
+    checks = []
+    validity = incremental.IncrementalCache.validity
+    def counting(cache, entry, index):
+        checks[-1] += 1
+        return validity(cache, entry, index)
+    monkeypatch.setattr(incremental.IncrementalCache, "validity", counting)
+    work = []
+    for count in (50, 200, 800):
+        grammar = with_options(language.json, iterative=iterative)
+        document = tinyparser.parse_document(grammar, "[%s]" % ", ".join(map(str, range(count))))
+        checks.clear()
+        for edit in ("middle", "append", "append", "first", "middle", "remove"):
+            text = document.text
+            if edit == "middle":
+                position = text.index(", ", len(text) // 2) + 2
+                edit = (position, position + 1, "7")
+            elif edit == "append":
+                edit = (len(text) - 1, len(text) - 1, ", 5")
+            elif edit == "first":
+                edit = (1, 2, "9")
+            else:
+                edit = (text.rindex(", "), len(text) - 1, "")
+            checks.append(0)
+            document = tinyparser.reparse(document, edit)
+            assert document.result == tinyparser.parse(grammar, document.text)
+        work.append(checks[:])
+    assert work[0] == work[1] == work[2]
+
+# The edits a document keeps to move its tokens and to check its cache entries against stay fewer than its tokens,
+# while the tokens and results stay the same as those of the edited text
+def test_reparse_edit_log(iterative):
+    grammar = with_options(language.cpp, iterative=iterative)
+    document = tinyparser.parse_document(grammar, "\n".join("a%d + b * (c - %d) / x++; { d; e; f; g; }" % (number, number) for number in range(4)))
+    positions = lambda tokens: [(token.position.index, token.position.line, token.position.column, token.end.index, token.end.line, token.end.column) for token in tokens]
+    for number in range(600):
+        text = document.text
+        position = text.find("b", number * 37 % len(text))
+        if number % 3 == 0 or position < 0: # Leaves the tokens behind the edit unused for a while
+            position = text.index("b", len(text) // 2)
+        edit = (position, position + 1, ("qb", "b\n", "b ")[number % 3])
+        if number % 100 == 99: # Within a list, whose levels weren't looked up for a while
+            position = text.find("e", number * 37 % len(text))
+            edit = (position, position + 1, "e\n")
+        document = tinyparser.reparse(document, edit)
+        assert len(document.cache.edits) <= len(document.tokens) + 1 and len(document.shifts) <= len(document.tokens)
+        if number % 50 == 49:
+            assert dump(document.result) == dump(tinyparser.parse(grammar, document.text))
+            assert positions(document.tokens) == positions(tinyparser.parse_document(grammar, document.text).tokens)
@@ -0,0 +1,68 @@
+import io
+import pytest
+import tinyparser
+import tinyparser.language as language
+from tinyparser import Token, TokenType, TokenStore
+from extendableenum import inheritable_enum
+
+def tokens_of(store):
+    while store.fill():
+        pass
+    return [(token.type, token.value) for token in store.slice(0, len(store.type_ids))]
+
+# Streamed input is tokenized like the whole text, even where a token is longer than the input buffered ahead
+@pytest.mark.parametrize("lookahead, chunk_size", [(4, 2), (1, 1), (3, 5)])
+def test_token_longer_than_lookahead(lookahead, chunk_size):
+    text = '["' + "A B" * 10 + '", 12345678, "x"]'
+    chunks = [text[start:start + chunk_size] for start in range(0, len(text), chunk_size)]
+    expected = tokens_of(TokenStore(language.json.compile().scanner, [text]))
+    assert tokens_of(TokenStore(language.json.scanner, chunks, lookahead=lookahead)) == expected
+    assert [token_type for token_type, _ in expected] == [Token.LEFT_SQUARE_BRACKET, Token.STRING, Token.COMMA, Token.NUMBER, Token.COMMA, Token.STRING, Token.RIGHT_SQUARE_BRACKET]
+
+def test_operator_split_across_chunks():
+    store = TokenStore(language.cpp.compile().scanner, ["a+", "+", "b;"], lookahead=1)
+    assert tokens_of(store) == [(Token.IDENTIFIER, "a"), (Token.DOUBLE_PLUS, "++"), (Token.IDENTIFIER, "b"), (Token.SEMICOLON, ";")]
+
+def test_parse_file_with_long_string():
+    text = '["' + "A B" * 46000 + '"]'
+    assert tinyparser.parse(language.json, io.StringIO(text)) == tinyparser.parse(language.json, text) == ["A B" * 46000]
+
+# A string token many chunks long, with whitespaces and other tokens' characters at the chunk boundaries
+@pytest.mark.parametrize("chunk_size", [1, 2, 7])
+def test_string_split_across_chunks(chunk_size):
+    text = '{"key": "' + 'a, [1] : b ' * 200 + '", "x": 1}'
+    chunks = [text[start:start + chunk_size] for start in range(0, len(text), chunk_size)]
+    expected = tokens_of(TokenStore(language.json.compile().scanner, [text]))
+    assert tokens_of(TokenStore(language.json.scanner, chunks, lookahead=2)) == expected
+    assert expected[3] == (Token.STRING, 'a, [1] : b ' * 200)
+
+# Without prefix patterns (e.g. if the internal modules of "re" changed), streamed input is read completely
+def test_streaming_without_prefix_patterns(monkeypatch):
+    monkeypatch.setattr(tinyparser, "prefix_patterns_supported", False)
+    scanner = tinyparser.Scanner(Token, " \t\r\n")
+    assert not scanner.streaming
+    text = '["' + "A B" * 100 + '", 12345678]'
+    chunks = [text[start:start + 3] for start in range(0, len(text), 3)]
+    assert tokens_of(TokenStore(scanner, chunks, lookahead=1)) == tokens_of(TokenStore(language.json.compile().scanner, [text]))
+
+# Token types, whose anchors, word boundaries or lookbehinds could see the previous token, are matched against the rest
+# of the input, as if it started with the token. Anchors and boundaries further inside a pattern are left combined.
+@inheritable_enum
+class LookingTokens(TokenType):
+    ANCHORED = r"^a|^b"
+    BOUNDARY = r"^\bc"
+    LOOKBEHIND = r"^(?<![a-z])d"
+    IDENTIFIER = r"^[a-z]+\b"
+
+@pytest.mark.parametrize("text, expected", [
+    ("ab ba", [("ANCHORED", "a"), ("ANCHORED", "b"), ("ANCHORED", "b"), ("ANCHORED", "a")])
+    , ("ac ad", [("ANCHORED", "a"), ("BOUNDARY", "c"), ("ANCHORED", "a"), ("LOOKBEHIND", "d")])
+    , ("xc xd", [("IDENTIFIER", "xc"), ("IDENTIFIER", "xd")])
+])
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_patterns_looking_before_tokens(text, expected, chunk_size):
+    scanner = tinyparser.Scanner(LookingTokens, " ")
+    assert [sliced for _, _, sliced in scanner.segments] == [True, True, True, False]
+    chunks = [text] if chunk_size is None else [text[start:start + chunk_size] for start in range(0, len(text), chunk_size)]
+    assert [(token_type.name, value) for token_type, value in tokens_of(TokenStore(scanner, chunks, lookahead=1))] == expected
+    assert [sliced for _, _, sliced in tinyparser.Scanner(Token, " ").segments] == [False]
@@ -1,33 +1,61 @@
 from enum import Enum
 from inspect import isclass
+from itertools import islice
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from time import perf_counter, monotonic
 from extendableenum import inheritable_enum
+import codecs
+import math
 import re
+import sys
+try:
+    from re import _parser as sre_parse, _compiler as sre_compile, _constants as sre_constants
+except ImportError: # Before Python 3.11
+    try:
+        import sre_parse, sre_compile, sre_constants
+    except ImportError: # Streamed input is then read completely (see "Scanner.prefix_pattern")
+        sre_parse = sre_compile = sre_constants = None
 
 # Miscellaneous
 def ensure_list(value):
     return value if isinstance(value, list) else [value]
-def set_or_append(dict, key, value):
+# Sets "dict[key]" to "value" or - if it is set already - appends "value" to it (as list).
+# The lists of all keys in "owned" were created for "dict" and are extended in place. Other lists might belong
+# to further results (e.g. memoized ones), so they are copied once before and their keys are added to "owned".
+def set_or_append(dict, key, value, owned=None):
     orig_value = dict.get(key, None)
-    if orig_value is not None:
-        if value is not None:
-            value = ensure_list(value)
-            orig_value = ensure_list(orig_value)
-            dict[key] = [*orig_value, *value]
-    else:
+    if orig_value is None:
         dict[key] = value
+    elif value is not None:
+        if owned is None or key not in owned:
+            orig_value = dict[key] = [*orig_value] if isinstance(orig_value, list) else [orig_value]
+            if owned is not None:
+                owned.add(key)
+        if isinstance(value, list):
+            orig_value.extend(value)
+        else:
+            orig_value.append(value)
 class input_cursor:
+    __slots__ = ("index", "line", "column")
     def __init__(self, index=1, line=1, column=1):
         self.index = index
         self.line = line
         self.column = column
-def take_from_input(input, count, cursor:input_cursor, regex=re.compile(r"\r\n|\r|\n")):
-    result = input_cursor(cursor.index + count, cursor.line, cursor.column + count)
-    for match in regex.finditer(input, endpos=count):
-        result.line += 1
-        result.column = count - match.end() + 1
-    return input[:count], input[count:], result
+def advance_line_column(input, start, end, line, column, regex=re.compile(r"\r\n|\r|\n")):
+    column += end - start
+    for match in regex.finditer(input, start, end):
+        line += 1
+        column = end - match.end() + 1
+    return line, column
+def advance_cursor(input, start, end, cursor:input_cursor):
+    return input_cursor(cursor.index + end - start, *advance_line_column(input, start, end, cursor.line, cursor.column))
+def take_from_input(input, count, cursor:input_cursor):
+    return input[:count], input[count:], advance_cursor(input, 0, count, cursor)
 
 # Standard Tokenization Scheme
+exact_types = {} # (Token class, string) -> the token type "exactly" found for it
 @inheritable_enum
 class TokenType(Enum):
     def __init__(self, pattern):
@@ -36,10 +64,16 @@ class TokenType(Enum):
         return InputToken(self, *args, **kwargs)
     @classmethod
     def exactly(cls, value):
-        for token_type in cls:
-            if token_type.pattern.match(value):
-                return token_type(value)
-        raise Exception("The string %s does not correspond to any token type in Enum %s." % (value, cls))
+        # The token type of each string is only searched once, the value is interned (see "Language.literals")
+        token_type = exact_types.get((cls, value), None)
+        if token_type is None:
+            for token_type in cls:
+                if token_type.pattern.match(value):
+                    break
+            else:
+                raise Exception("The string %s does not correspond to any token type in Enum %s." % (value, cls))
+            exact_types[(cls, value)] = token_type
+        return token_type(sys.intern(value))
 class Token(TokenType):
     NEWLINE                 = r"^\r\n|\r|\n"
     DOUBLE_EQUAL            = r"^=="
@@ -89,6 +123,17 @@ class AST:
             if key:
                 setattr(self, key, value)
 
+# Operator Tables
+# A rule can also be an operator table. It matches expressions of operands (references to "operand") and operators:
+# The operators are given as "(kind, token type(s), precedence, target)" with the kind being "left" or "right" for
+# binary operators (the associativity) or "prefix" or "postfix" for unary ones. Operators with a higher precedence bind
+# tighter. Binary operations are built with the fields "left", "type" and "right", unary ones with "type" and "operand".
+# An operand can have any number of prefix operators, but only one postfix operator.
+class OperatorTable:
+    def __init__(self, operand, *operators):
+        self.operand = operand
+        self.operators = operators
+
 # Definition of a Language
 class Language:
     def __init__(self, rules, token_class=Token, root_rule="root."
@@ -97,6 +142,21 @@ class Language:
         # List of "target" types/values for which the intermediate dictionary is enriched with...
         , make_grammar_rule_available=[AST] # The name of the matching rule as "matching_rule"
         , make_input_tokens_available=[AST]    # The list of input tokens as "input_tokens"
+
+        # Memoize the results of all rule references during one call to "parse" (packrat parsing)
+        , packrat=False # Either True (unbounded) or the maximum number of memoized results
+
+        # Parse with an explicit stack instead of recursion (the input length is then not bounded by the recursion limit)
+        , iterative=False
+
+        # Record per rule and per token type statistics into this "Profiler" on every parse
+        , profiler=None
+
+        # Parse with Python code generated from the rules (see "tinyparser.codegen")
+        , codegen=False # Either True (cached in "~/.cache/tinyparser") or the directory to cache the generated code in
+
+        # Reuse the results of inputs that were parsed before (see "tinyparser.caching")
+        , result_cache=None # A "ResultCache"
     ):
         self.rules = rules
         self.token_class = token_class
@@ -105,279 +165,1600 @@ class Language:
         self.default_target = default_target
         self.make_grammar_rule_available = make_grammar_rule_available
         self.make_input_tokens_available = make_input_tokens_available
+        self.packrat = packrat
+        self.iterative = iterative
+        self.profiler = profiler
+        self.codegen = codegen
+        self.result_cache = result_cache
+        self.compiled_rules = None # Rule key -> CompiledRule
+        self.rule_index = None # Rule path -> list of all matching compiled rules
+        self.dispatch_index = None # Rule path -> ({token type: matching rules that can start with it}, nullable matching rules)
+                                   # For token types some rules only start with as literals: {literal value: matching rules}
+        self.scanner = None
+        self.generated_parser = None
+
+    # Compiled data is not pickled, but compiled again where needed
+    def __getstate__(self):
+        return {**self.__dict__, "compiled_rules": None, "rule_index": None, "dispatch_index": None, "scanner": None, "generated_parser": None}
+
+    # Compile all rules and index them by every rule path that is referenced
+    # Call this again, whenever you modify "rules" after the first parse
+    def compile(self):
+        self.compiled_rules = {key: CompiledRule(self, key, rule) for key, rule in self.rules.items()}
+        self.scanner = Scanner(self.token_class, self.strip_whitespaces, self.literals())
+        self.rule_index = {}
+        self.dispatch_index = {}
+        self.generated_parser = None
+        self.lookup(self.root_rule)
+        for rule in self.compiled_rules.values():
+            for options in rule.steps:
+                for option in options:
+                    if isinstance(option.requirement, str):
+                        self.lookup(option.requirement)
+        self.find_chains()
+        self.compute_first_sets()
+        self.find_certain_options()
+        return self
+    def lookup(self, rule_path):
+        if self.compiled_rules is None:
+            self.compile()
+        viable_rules = self.rule_index.get(rule_path, None)
+        if viable_rules is None:
+            viable_rules = [rule for key, rule in self.compiled_rules.items() if key.startswith(rule_path)]
+            self.rule_index[rule_path] = viable_rules
+        return viable_rules
+
+    # The literal tokens (like keywords) the rules require as "(token type, value)", their values are interned
+    def literals(self):
+        literals = {}
+        for rule in self.compiled_rules.values():
+            requirements = [option.requirement for options in rule.steps for option in options]
+            if rule.operators is not None:
+                requirements += [operator.requirement for operators in rule.operators.values() for operator in operators]
+            for requirement in requirements:
+                if isinstance(requirement, InputToken) and isinstance(requirement.value, str):
+                    requirement.value = sys.intern(requirement.value)
+                    literals[(requirement.type, requirement.value)] = None
+        return list(literals)
+
+    # Marks the options, that append (or merge) the results of rules of the same kind of chain as their own rule
+    def find_chains(self):
+        for rule in self.compiled_rules.values():
+            if rule.chain is None or not rule.steps:
+                continue
+            for option in rule.steps[-1]:
+                if isinstance(option.requirement, str) and option.destinations == [(None if rule.chain is list else "", None)]:
+                    if any(referenced_rule.chain is rule.chain for referenced_rule in self.lookup(option.requirement)):
+                        option.tail = rule.chain
+
+    # The rules matching "rule_path" in order, without those that cannot start with the token at "index"
+    def candidates(self, rule_path, token_list, index):
+        if self.compiled_rules is None:
+            self.compile()
+        dispatch = self.dispatch_index.get(rule_path, None)
+        if dispatch is None:
+            viable_rules = self.lookup(rule_path)
+            dispatch = self.dispatch_index[rule_path] = (
+                {
+                    token_type: self.literal_dispatch(token_type, [rule for rule in viable_rules if rule.nullable or token_type in rule.first])
+                    for token_type in set().union(*[rule.first for rule in viable_rules])
+                }
+                , [rule for rule in viable_rules if rule.nullable]
+            )
+        rules = dispatch[0].get(token_list.type_at(index), dispatch[1])
+        if type(rules) is dict: # Some of the rules only start with certain values of the token type
+            return rules.get(token_list.literal_at(index), rules[None])
+        return rules
+    def literal_dispatch(self, token_type, rules):
+        values = set().union(*[rule.first_literals.get(token_type, ()) for rule in rules])
+        if not values:
+            return rules
+        dispatch = { # Rules that can match no tokens are kept for every value
+            value: [rule for rule in rules if rule.nullable or token_type not in rule.first_literals or value in rule.first_literals[token_type]]
+            for value in values
+        }
+        dispatch[None] = [rule for rule in rules if rule.nullable or token_type not in rule.first_literals] # Any other value
+        return dispatch
+
+    # Determine the token types every rule can start with (its FIRST set) and whether it can match no tokens at all
+    # Token types a rule can only start with as certain literal values are recorded with these values, too.
+    def compute_first_sets(self):
+        def add(first, first_literals, token_type, values=None): # "values" None: any value
+            if token_type not in first:
+                first.add(token_type)
+                if values is not None:
+                    first_literals[token_type] = set(values)
+            elif token_type in first_literals:
+                if values is None:
+                    del first_literals[token_type]
+                else:
+                    first_literals[token_type] |= values
+        changed = True
+        while changed: # Rule references can be recursive, so repeat until nothing changes anymore
+            changed = False
+            for rule in self.compiled_rules.values():
+                first, first_literals, nullable = set(), {}, True
+                for options in rule.steps:
+                    step_nullable = False
+                    for option in options:
+                        requirement = option.requirement
+                        if isinstance(requirement, TokenType):
+                            add(first, first_literals, requirement)
+                        elif isinstance(requirement, InputToken):
+                            add(first, first_literals, requirement.type, {requirement.value} if isinstance(requirement.value, str) else None)
+                        elif isinstance(requirement, str):
+                            for referenced_rule in self.lookup(requirement):
+                                for token_type in referenced_rule.first:
+                                    add(first, first_literals, token_type, referenced_rule.first_literals.get(token_type, None))
+                                step_nullable = step_nullable or referenced_rule.nullable
+                        else:
+                            step_nullable = True # Unknown requirements are never filtered out
+                    if not step_nullable: # Later steps cannot start the rule
+                        nullable = False
+                        break
+                if first != rule.first or first_literals != rule.first_literals or nullable != rule.nullable:
+                    rule.first, rule.first_literals, rule.nullable = first, first_literals, nullable
+                    changed = True
+
+    # Determine the options that always match, as they reference a rule path with a rule that always matches (at least one
+    # without any steps), so the parser knows when a rule can't fail anymore (see "oldest_index")
+    def find_certain_options(self):
+        certain_paths = set()
+        def certain(option):
+            return isinstance(option.requirement, str) and option.requirement in certain_paths
+        changed = True
+        while changed: # Rule references can be recursive, so repeat until nothing changes anymore
+            changed = False
+            for rule_path, rules in self.rule_index.items():
+                if rule_path not in certain_paths and any(rule.operators is None and all(any(map(certain, options)) for options in rule.steps) for rule in rules):
+                    certain_paths.add(rule_path)
+                    changed = True
+        for rule in self.compiled_rules.values():
+            rule.certain_options = [next((number for number, option in enumerate(options) if certain(option)), None) for options in rule.steps]
+            rule.fallible_after = [None in rule.certain_options[number + 1:] for number in range(len(rule.steps))]
+
+# Compiled Grammar
+class CompiledOption:
+    def __init__(self, requirement, destination):
+        self.requirement = requirement
+        self.destinations = []
+        for destination in ensure_list(destination):
+
+            # The destination can actually be a tuple "(destination, transformer)"
+            transformer = None
+            if isinstance(destination, tuple):
+                destination, transformer = destination[0], destination[1]
+            self.destinations.append((destination, transformer))
+        self.tail = None # The kind of chain, if the referenced rules can leave building their results to this one (see "Chain")
+class CompiledOperator:
+    def __init__(self, language: Language, key, kind, requirement, precedence, target):
+        self.kind = kind
+        self.requirement = requirement
+        self.precedence = precedence
+        self.rule = CompiledRule(language, key, (target,)) # Builds the operations
+class CompiledRule:
+    def __init__(self, language: Language, key, rule):
+
+        # rule is "(target, steps...)" or "[steps...]" just "target" or an "OperatorTable"
+        self.operators = None
+        if isinstance(rule, OperatorTable):
+            self.operand = rule.operand
+            self.operators = {"prefix": [], "postfix": [], "left": [], "right": []}
+            for kind, requirements, precedence, operator_target in rule.operators:
+                for requirement in ensure_list(requirements):
+                    self.operators[kind].append(CompiledOperator(language, key, kind, requirement, precedence, operator_target))
+            self.operators["binary"] = [*self.operators.pop("left"), *self.operators.pop("right")]
+
+            # For the analysis of the grammar, it is a rule with one step: a prefix operator or the operand
+            target = None
+            steps = [[operator.requirement for operator in self.operators["prefix"]] + [rule.operand]]
+        elif isinstance(rule, list):
+            target = language.default_target
+            steps = rule
+        elif isinstance(rule, tuple):
+            target, *steps = rule
+        else:
+            target = rule
+            steps = []
+        self.key = key
+        self.target = target
+        self.steps = []
+        for step in steps:
+
+            # A step can be a tuple "(step, destination)"
+            destination = None
+            if isinstance(step, tuple):
+                step, destination = step[0], step[1]
+
+            # The step can actually be a list "(step-option-1, step-option-2, etc.)"
+            options = []
+            for option in ensure_list(step):
+
+                # Each step option can itself be a tuple "(step, destination-override)"
+                actual_destination = destination
+                if isinstance(option, tuple):
+                    option, actual_destination = option[0], option[1] # You can also specify a destination per option
+                options.append(CompiledOption(option, actual_destination))
+            self.steps.append(options)
+        self.first = set() # The token types this rule can start with (see "Language.compute_first_sets")
+        self.first_literals = {} # Token type -> the literal values, if this rule can only start with these of the type
+        self.nullable = False # Whether this rule can match without consuming any tokens
+        self.certain_options = [None] * len(self.steps) # Per step, the number of the first option that always matches (see "Language.find_certain_options")
+        self.fallible_after = [True] * len(self.steps) # Per step, whether any later step might not match
+
+        # Enrich with debug information?
+        def check_entry(entry):
+            if target == entry or isinstance(target, entry):
+                return True
+            return issubclass(target, entry) if isclass(target) and isclass(entry) else False
+        self.make_input_tokens_available = True in [check_entry(entry) for entry in language.make_input_tokens_available]
+        self.make_grammar_rule_available = True in [check_entry(entry) for entry in language.make_grammar_rule_available]
+
+        # Plain lists and dictionaries can be chained: If the last step appends (or merges) the result of another rule of
+        # the same kind, that rule doesn't build its own result, but leaves its steps to be added to this one (see "Chain")
+        self.chain = None
+        if self.operators is None and isinstance(target, (list, dict)) and not target and not self.make_input_tokens_available and not self.make_grammar_rule_available:
+            destinations = [destination for options in self.steps for option in options for destination in option.destinations]
+            if not any(isinstance(destination, int) or callable(transformer) for destination, transformer in destinations):
+                self.chain = type(target)
+    def build(self, result):
+
+        # a) Return the dictionary
+        target = self.target
+        if isinstance(target, dict):
+            if result[None] == [] or (None not in target): # If we didn't collect elements without destination, remove the key 'None'
+                return {key: value for key, value in result.items() if key is not None}
+            else:
+                return result
+
+        # b) Return the results that didn't have an explicit destination (as list)
+        elif target == []:
+            return result[None]
+
+        # c) Return the results that didn't have an explicit destination (converted to string and concatenated)
+        elif target == "":
+            return "".join([str(value) for value in result[None]])
+
+        # d) Return the field with the supplied name
+        elif isinstance(target, str):
+            return result.get(target, None)
+
+        # e) Construct an object of the supplied class and pass the dict as named arguments to constructor
+        elif isclass(target) and "__init__" in vars(target):
+            return target(*result[None], **{key: value for key, value in result.items() if key is not None})
+
+        # f) Create an object of the supplied class and let the dictionary set its attributes
+        elif isclass(target):
+            object_result = target()
+            for key, value in result.items():
+                if key:
+                    setattr(object_result, key, value)
+            return object_result
+
+        # g) Call a function with the resulting dictionary as named parameters
+        elif callable(target):
+            return target(*result[None], **{key: value for key, value in result.items() if key is not None})
+
+        # h) return just the target
+        elif target is not None:
+            return target
+
+        # h) Return the result or the results that didn't have an explicit destination (list or plain value)
+        return result[None][0] if len(result[None]) == 1 else result[None] or None
 
 # Tokenizer
 class InputToken:
+    __slots__ = ("type", "value", "verbatim", "space_before", "position", "end", "groups")
     def __init__(self, type: TokenType, value=None, space_before=None, position=input_cursor, end=input_cursor):
         self.type = type
         self.verbatim = self.value = value
         self.space_before = space_before
         self.position = position
         self.end = end
-def tokenize(language: Language, input: str):
-    result = []
-    space_before = None
-    position = input_cursor()
-    if language.strip_whitespaces:
-        new_input = input.lstrip(language.strip_whitespaces)
-        space_before, input, position = take_from_input(input, len(input)-len(new_input), position)
-    while input:
-        for token_type in language.token_class:
-            if match := token_type.pattern.match(input):
-                start = position
-                _, input, position = take_from_input(input, match.end(), position)
-                token = InputToken(token_type, match.group(), space_before, start, position)
-                for key, value in match.groupdict().items():
-                    setattr(token, key, value) # Add all named groups to the token as attributes
-                result.append(token)
-                break
+        self.groups = None
+    def __getattr__(self, name): # Named groups of the token type are available as attributes
+        if name != "groups" and self.groups and name in self.groups:
+            return self.groups[name]
+        raise AttributeError("'InputToken' object has no attribute '%s'" % name)
+    def set_groups(self, groups):
+        self.groups = groups
+        for name in self.__slots__:
+            if name in groups:
+                setattr(self, name, groups[name]) # E.g. a group "value" overrides the value of the token
+
+# A match of a token type against the rest of the input (see "Scanner.looks_before"), with its positions in the input
+class SlicedMatch:
+    __slots__ = ("match", "offset", "lastindex")
+    def __init__(self, match, offset):
+        self.match = match
+        self.offset = offset
+        self.lastindex = match.lastindex
+    def start(self, group=0):
+        start = self.match.start(group)
+        return start if start < 0 else self.offset + start
+    def end(self, group=0):
+        end = self.match.end(group)
+        return end if end < 0 else self.offset + end
+    def group(self, *groups):
+        return self.match.group(*groups)
+
+# Matches all token types of a token class at once, using a single regular expression
+# Each token type becomes a named group "_<number>" in enum order, so the first listed type still wins. Token types,
+# whose patterns cannot be made part of it, are matched on their own (in between the token types before and after).
+class Scanner:
+    flag_letters = ((re.ASCII, "a"), (re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x"))
+    def __init__(self, token_class, strip_whitespaces=None, literals=()):
+        self.whitespace = re.compile("[%s]*" % re.escape(strip_whitespaces)) if strip_whitespaces else None
+        self.segments = [] # (pattern, token type id, matched against the rest of the input) or (pattern of several token types, None, False) in enum order
+        self.token_types = [None] # Token type id (the group index in the pattern of its segment) -> token type
+        self.named_groups = {} # Token type -> list of "(attribute, group index)"
+        alternatives = [] # The token types of the current segment as "(number, token type, source in the segment)"
+        for number, token_type in enumerate([*token_class, None]):
+            if token_type is not None:
+                try:
+                    alternatives.append((number, token_type, self.embed(number, token_type)))
+                    continue
+                except ValueError:
+                    pass # Matched on its own
+            if alternatives: # Finish the current segment
+                offset = len(self.token_types) - 1 # Never matching groups keep the group indices of the segments apart
+                pattern = re.compile("%s(?:%s)" % ("(?:%s){0}" % ("()" * offset) if offset else "", "|".join(source for _, _, source in alternatives)))
+                self.token_types.extend([None] * (pattern.groups - offset))
+                for alternative_number, alternative_type, _ in alternatives:
+                    self.token_types[pattern.groupindex["_%d" % alternative_number]] = alternative_type
+                    self.named_groups[alternative_type] = [
+                        (name, pattern.groupindex["_%d_%s" % (alternative_number, name)])
+                        for name in alternative_type.pattern.groupindex
+                    ]
+                self.segments.append((pattern, None, False))
+                alternatives = []
+            if token_type is not None:
+                sliced = self.looks_before(token_type.pattern)
+                pattern = token_type.pattern if sliced else re.compile(self.unanchored(token_type.pattern), token_type.pattern.flags)
+                self.segments.append((pattern, len(self.token_types), sliced))
+                self.token_types.append(token_type)
+                self.named_groups[token_type] = list(pattern.groupindex.items())
+        self.pattern = self.segments[0][0] if len(self.segments) == 1 and self.segments[0][1] is None else None # The usual case
+
+        # Token types with bounded tokens can only match beyond the buffered input near its end (see "prefix_pattern")
+        self.streaming = prefix_patterns_supported # Otherwise, streamed input is read completely before tokenizing it
+        self.prefix_starts = {} # Character -> the first token type id with unbounded tokens, that can start with it
+        if self.streaming:
+            widths = [None if token_type is None else sre_parse.parse(token_type.pattern.pattern, token_type.pattern.flags).getwidth()[1] for token_type in self.token_types]
+            self.bounded_width = max([width for width in widths if width is not None and width < sre_constants.MAXREPEAT], default=0)
+            self.prefixes = self.prefix_pattern([number for number, width in enumerate(widths) if width is not None])
+            self.unbounded_prefixes = self.prefix_pattern([number for number, width in enumerate(widths) if width is not None and width >= sre_constants.MAXREPEAT])
+
+        # The literal values "(token type, value)" the rules require are numbered from 1 on, so the tokenizer can look
+        # up every token once (in a dictionary per token type) and the parser doesn't need to slice the input to compare
+        # them. Token types with named groups are left out, as these might override the value.
+        self.literal_values = [None] # Literal number -> interned value
+        self.literal_tables = [None] * len(self.token_types) # Token type id -> {value: literal number} or None
+        groups = {token_type: group for group, token_type in enumerate(self.token_types) if token_type is not None}
+        for token_type, value in literals:
+            group = groups.get(token_type, None)
+            if group is None or self.named_groups[token_type]:
+                continue
+            if self.literal_tables[group] is None:
+                self.literal_tables[group] = {}
+            self.literal_tables[group][value] = len(self.literal_values)
+            self.literal_values.append(value)
+
+    # The id of the token type matching at "position" and the match (or "None, None")
+    def match(self, text, position):
+        for pattern, token_type_id, sliced in self.segments:
+            if sliced:
+                match = pattern.match(text[position:])
+                if match is not None:
+                    return token_type_id, SlicedMatch(match, position)
+                continue
+            match = pattern.match(text, position)
+            if match is not None:
+                return match.lastindex if token_type_id is None else token_type_id, match
+        return None, None
+
+    # Streamed input is only tokenized up to the end of what was read so far. To not take a token, where a token type
+    # listed before it would match with more input, this pattern matches the rest of the buffered input, if a token type
+    # could still match it, once more input is read. Returns the pattern (or None without token types) and the token type
+    # ids of its groups. It is built from the parsed patterns of the token types, turned into ones matching the prefixes
+    # of their tokens. Anchors, lookarounds and group references are assumed to match anything, which only means reading
+    # ahead more. As this relies on the internal modules of "re", it is checked once on import (see
+    # "check_prefix_patterns"). Without it, every token is assumed to possibly continue.
+    def prefix_pattern(self, token_type_ids):
+        if not token_type_ids:
+            return None, None
+        state = sre_parse.State()
+        alternatives, prefix_types = [], [None]
+        for token_type_id in token_type_ids:
+            pattern = self.token_types[token_type_id].pattern
+            items = self.prefixes_of(state, list(sre_parse.parse(pattern.pattern, pattern.flags)))
+            flags = pattern.flags & (re.IGNORECASE | re.MULTILINE | re.DOTALL | re.ASCII | re.UNICODE)
+            group = state.opengroup()
+            items = sre_parse.SubPattern(state, [(sre_constants.SUBPATTERN, (None, flags, 0, sre_parse.SubPattern(state, items)))])
+            state.closegroup(group, items)
+            alternatives.append(sre_parse.SubPattern(state, [
+                (sre_constants.SUBPATTERN, (group, 0, 0, items))
+                , (sre_constants.AT, sre_constants.AT_END_STRING)
+            ]))
+            prefix_types.append(token_type_id)
+        return sre_compile.compile(sre_parse.SubPattern(state, [(sre_constants.BRANCH, (None, alternatives))]), re.UNICODE), prefix_types
+
+    # Whether a token type listed before "kind" could match the rest of the buffered "text" from "start" on with more input
+    def continues(self, text, start, kind, end=None):
+        if not self.streaming:
+            return True
+        end = len(text) if end is None else end # Where the buffered text ends
+        if end - start < self.bounded_width:
+            prefixes, prefix_types = self.prefixes
+        else:
+            prefixes, prefix_types = self.unbounded_prefixes
+            if prefixes is None or not self.may_continue(text[start], kind):
+                return False
+        match = prefixes.match(text, start, end)
+        return match is not None and prefix_types[match.lastindex] < kind
+
+    # Whether a token type with unbounded tokens, that is listed before "kind", can start with "character"
+    def may_continue(self, character, kind):
+        if not self.streaming:
+            return True
+        first = self.prefix_starts.get(character, None)
+        if first is None:
+            prefixes, prefix_types = self.unbounded_prefixes
+            match = prefixes.match(character) if prefixes is not None else None
+            first = self.prefix_starts[character] = len(self.token_types) if match is None else prefix_types[match.lastindex]
+        return first < kind
+    def anything(self, state):
+        character = (sre_constants.IN, [(sre_constants.CATEGORY, sre_constants.CATEGORY_SPACE), (sre_constants.CATEGORY, sre_constants.CATEGORY_NOT_SPACE)])
+        return (sre_constants.MAX_REPEAT, (0, sre_constants.MAXREPEAT, sre_parse.SubPattern(state, [character])))
+    def prefixes_of(self, state, items):
+        # Either the first item matches partly, or it matches and the rest matches partly
+        if not items:
+            return []
+        first = self.prefix_of(state, *items[0])
+        if len(items) == 1:
+            return first
+        rest = self.relaxed(state, items[:1]) + self.prefixes_of(state, items[1:])
+        return [(sre_constants.BRANCH, (None, [sre_parse.SubPattern(state, rest), sre_parse.SubPattern(state, first)]))]
+    def prefix_of(self, state, op, value):
+        constants = sre_constants
+        if op in (constants.LITERAL, constants.NOT_LITERAL, constants.ANY, constants.IN):
+            return [(constants.MAX_REPEAT, (0, 1, sre_parse.SubPattern(state, [(op, value)])))]
+        elif op is constants.BRANCH:
+            return [(op, (None, [sre_parse.SubPattern(state, self.prefixes_of(state, list(items))) for items in value[1]]))]
+        elif op is constants.SUBPATTERN:
+            return [(op, (None, value[1], value[2], sre_parse.SubPattern(state, self.prefixes_of(state, list(value[3])))))]
+        elif op in (constants.MAX_REPEAT, constants.MIN_REPEAT, getattr(constants, "POSSESSIVE_REPEAT", None)):
+            minimum, maximum, items = value
+            if maximum == 0:
+                return []
+            repeated = sre_parse.SubPattern(state, self.relaxed(state, list(items)))
+            return [(constants.MAX_REPEAT, (0, maximum if maximum == constants.MAXREPEAT else maximum - 1, repeated)), *self.prefixes_of(state, list(items))]
+        elif op is getattr(constants, "ATOMIC_GROUP", None):
+            return self.prefixes_of(state, list(value))
+        elif op is constants.GROUPREF_EXISTS:
+            return [(constants.BRANCH, (None, [sre_parse.SubPattern(state, self.prefixes_of(state, list(items or []))) for items in value[1:]]))]
+        elif op in (constants.AT, constants.ASSERT, constants.ASSERT_NOT):
+            return []
+        return [self.anything(state)] # Group references
+    def relaxed(self, state, items):
+        # The same items, without groups, and with anchors, lookarounds and group references matching anything
+        constants = sre_constants
+        result = []
+        for op, value in items:
+            if op is constants.BRANCH:
+                result.append((op, (None, [sre_parse.SubPattern(state, self.relaxed(state, list(alternative))) for alternative in value[1]])))
+            elif op is constants.SUBPATTERN:
+                result.append((op, (None, value[1], value[2], sre_parse.SubPattern(state, self.relaxed(state, list(value[3]))))))
+            elif op in (constants.MAX_REPEAT, constants.MIN_REPEAT, getattr(constants, "POSSESSIVE_REPEAT", None)):
+                result.append((constants.MAX_REPEAT, (value[0], value[1], sre_parse.SubPattern(state, self.relaxed(state, list(value[2]))))))
+            elif op is getattr(constants, "ATOMIC_GROUP", None):
+                result.append((constants.SUBPATTERN, (None, 0, 0, sre_parse.SubPattern(state, self.relaxed(state, list(value))))))
+            elif op is constants.GROUPREF_EXISTS:
+                result.append((constants.BRANCH, (None, [sre_parse.SubPattern(state, self.relaxed(state, list(items or []))) for items in value[1:]])))
+            elif op in (constants.AT, constants.ASSERT, constants.ASSERT_NOT):
+                continue
+            elif op is constants.GROUPREF:
+                result.append(self.anything(state))
+            else:
+                result.append((op, value))
+        return result
+
+    # Patterns are matched at the current offset, so their anchor "^" is implicit (and would only match at offset 0)
+    anchor_regex = re.compile(r"(?:\(\?[aiLmsux]+\))*(\s*)\^")
+    @classmethod
+    def unanchored(cls, pattern):
+        match = cls.anchor_regex.match(pattern.pattern)
+        if match is None or match.group(1) and not pattern.flags & re.VERBOSE:
+            return pattern.pattern
+        return pattern.pattern[:match.end() - 1] + pattern.pattern[match.end():]
+
+    # Whether the pattern of a token type can look at the input before its tokens (with an anchor like "^" or "\A" other
+    # than its leading "^", a word boundary or a lookbehind, that can be reached before the pattern took enough characters).
+    # Matched at an offset, these would see the previous token, so such token types are matched on their own against
+    # the rest of the input instead, as if it started with the token.
+    looks_before_regex = re.compile(r"^(?:\(\?[aiLmsux]+\))*(?:\\[AbB]|\(\?<[=!])|[|(:]\^|\\A") # Without the internal modules of "re": at the start of the pattern, an alternative or a group
+    def looks_before(self, pattern):
+        source = self.unanchored(pattern)
+        if sre_parse is None:
+            return self.looks_before_regex.search(source) is not None
+        parsed = sre_parse.parse(source, pattern.flags)
+        return self.reaches_before(parsed.state, list(parsed), 0)
+    def reaches_before(self, state, items, before):
+        # "before" is the least number of characters of the token, that the items are preceded by
+        constants = sre_constants
+        for op, value in items:
+            if op is constants.AT:
+                if before == 0 and value in (constants.AT_BEGINNING, constants.AT_BEGINNING_STRING, constants.AT_BOUNDARY, constants.AT_NON_BOUNDARY):
+                    return True
+            elif op in (constants.ASSERT, constants.ASSERT_NOT):
+                direction, assertion = value
+                width = assertion.getwidth()[1] if direction < 0 else 0
+                if width > before or self.reaches_before(state, list(assertion), before - width):
+                    return True
+            elif op is constants.BRANCH:
+                if any(self.reaches_before(state, list(alternative), before) for alternative in value[1]):
+                    return True
+            elif op is constants.SUBPATTERN:
+                if self.reaches_before(state, list(value[3]), before):
+                    return True
+            elif op in (constants.MAX_REPEAT, constants.MIN_REPEAT, getattr(constants, "POSSESSIVE_REPEAT", None)):
+                if self.reaches_before(state, list(value[2]), before):
+                    return True
+            elif op is getattr(constants, "ATOMIC_GROUP", None):
+                if self.reaches_before(state, list(value), before):
+                    return True
+            elif op is constants.GROUPREF_EXISTS:
+                if any(self.reaches_before(state, list(alternative), before) for alternative in value[1:] if alternative is not None):
+                    return True
+            before += sre_parse.SubPattern(state, [(op, value)]).getwidth()[0]
+        return False
+
+    # Turns the pattern of a token type into the named group "_<number>" of the combined pattern: its groups are renamed
+    # to "_<number>_<name>" or "_<number>_<group number>", so they don't clash with the ones of other token types, and
+    # global flags are turned into flags of the group. Raises a ValueError, if that doesn't result in a valid pattern.
+    syntax = r"""
+        \\([1-9][0-9]{0,2}) | \\. # Backreferences and other escapes
+        | \[\^?\]?(?:\\.|[^\]\\])*\] # Character sets
+        | \(\?P<(\w+)> | \(\?P=(\w+)\) | \(\?\((\w+)\) # Named groups, their references and conditions
+        | (\(\?[aiLmsux]+\)) # Global flags
+        | \(\? | (\() # Extensions, numbered groups
+    """
+    syntax_regex = re.compile(syntax, re.VERBOSE)
+    verbose_syntax_regex = re.compile(syntax + r"| \#[^\n]* # Comments", re.VERBOSE)
+    def embed(self, number, token_type):
+        pattern = token_type.pattern
+        if self.looks_before(pattern):
+            raise ValueError("The pattern of token type %s looks at the input before its tokens" % token_type)
+        verbose = pattern.flags & re.VERBOSE
+        group_names = {} # Group number -> new name
+        def rewrite(match):
+            backreference, name, reference, condition, flags, group = match.groups()
+            if backreference:
+                if len(backreference) == 3 and all(digit in "01234567" for digit in backreference):
+                    return match.group() # An octal escape
+                digits = backreference[:2] if backreference[1:2].isdigit() else backreference[:1]
+                if int(digits) not in group_names:
+                    raise ValueError("Token type %s refers to the unknown group %s" % (token_type, digits))
+                return "(?P=%s)%s" % (group_names[int(digits)], backreference[len(digits):])
+            elif name:
+                group_names[len(group_names) + 1] = "_%d_%s" % (number, name)
+                return "(?P<_%d_%s>" % (number, name)
+            elif reference:
+                return "(?P=_%d_%s)" % (number, reference)
+            elif condition:
+                if condition.isdigit():
+                    if int(condition) not in group_names:
+                        raise ValueError("Token type %s refers to the unknown group %s" % (token_type, condition))
+                    return "(?(%s)" % group_names[int(condition)]
+                return "(?(_%d_%s)" % (number, condition)
+            elif flags:
+                return "" # Added to the group of the token type instead
+            elif group:
+                group_names[len(group_names) + 1] = "_%d_%d" % (number, len(group_names) + 1)
+                return "(?P<%s>" % group_names[len(group_names)]
+            return match.group()
+        syntax_regex = self.verbose_syntax_regex if verbose else self.syntax_regex
+        source = syntax_regex.sub(rewrite, self.unanchored(pattern))
+        flags = "".join(letter for flag, letter in self.flag_letters if pattern.flags & flag)
+        source = "(?P<_%d>%s)" % (number, "(?%s:%s%s)" % (flags, source, "\n" if verbose else "") if flags else source)
+        try:
+            re.compile(source)
+        except re.error as error:
+            raise ValueError("The pattern of token type %s can't be combined with the others: %s" % (token_type, error))
+        return source
+
+# Whether prefix patterns work with the internal modules of "re" of this Python version: they have to match the prefixes
+# of a string token and nothing else
+def check_prefix_patterns():
+    if sre_parse is None:
+        return False
+    class Pattern: # Stands in for a token type
+        pattern = re.compile(r'"(?:[^"\\]|\\.)*"')
+    try:
+        scanner = object.__new__(Scanner)
+        scanner.token_types = [None, Pattern]
+        prefixes, prefix_types = scanner.prefix_pattern([1])
+        *matches, other = [prefixes.match(text) for text in ('"', '"a b', '"a\\', '"a\\"', 'a"')]
+        return all(match is not None and prefix_types[match.lastindex] == 1 for match in matches) and other is None
+    except Exception:
+        return False
+prefix_patterns_supported = check_prefix_patterns()
+def read_chunks(input, chunk_size=65536, encoding="utf-8"):
+    if isinstance(input, (str, bytes, bytearray)):
+        input = [input]
+    elif hasattr(input, "read"): # File objects
+        input = iter(lambda file=input: file.read(chunk_size) or None, None)
+    decoder = None
+    for chunk in input:
+        if isinstance(chunk, (bytes, bytearray)):
+            decoder = decoder or codecs.getincrementaldecoder(encoding)()
+            chunk = decoder.decode(chunk)
+        yield chunk
+    if decoder:
+        yield decoder.decode(b"", True)
+def tokenize(language: Language, input):
+    if language.scanner is None:
+        language.compile()
+    store = TokenStore(language.scanner, read_chunks(input))
+    while store.fill():
+        pass
+    return store.slice(0, len(store.type_ids))
+
+# Token Buffer (filled lazily, forgets tokens that no parser state can return to anymore)
+class TokenBuffer:
+    def __init__(self, tokens, batch_size=1024):
+        self.tokens = tokens if isinstance(tokens, list) else []
+        self.source = None if isinstance(tokens, list) else iter(tokens)
+        self.offset = 0 # Index of the first buffered token
+        self.batch_size = batch_size
+        self.frames = None # The rules being parsed (see "Frame"), while a parser reads the tokens
+    def get(self, index):
+        while index - self.offset >= len(self.tokens):
+            if not self.fill(index):
+                return None
+        return self.tokens[index - self.offset]
+    def type_at(self, index):
+        token = self.get(index)
+        return token.type if token else None
+    def value_at(self, index):
+        return self.get(index).value
+    def literal_at(self, index):
+        # The value of the token, if it is a literal value of the grammar (see "Scanner"), otherwise possibly None
+        return self.value_at(index)
+    def has_literal(self, index, value):
+        return self.value_at(index) == value
+    def slice(self, start, end):
+        while end - self.offset > len(self.tokens) and self.fill(start):
+            pass
+        return self.tokens[start - self.offset:end - self.offset]
+    def fill(self, index=None):
+        # Reads the next batch and, while parsing, forgets the tokens before "index" that the parser can't return to anymore
+        if self.source is None:
+            return False
+        batch = list(islice(self.source, self.batch_size))
+        if not batch:
+            self.source = None
+            return False
+        if self.frames is not None and index is not None:
+            self.release(oldest_index(self.frames, index))
+        self.tokens.extend(batch)
+        return True
+    def release(self, index):
+        if index > self.offset:
+            del self.tokens[:index - self.offset]
+            self.offset = index
+
+# Token Store (tokenizes its input lazily and keeps the tokens in parallel arrays)
+# Token objects are only created for tokens that are actually taken, named groups are matched again on demand
+class TokenStore(TokenBuffer):
+    def __init__(self, scanner: Scanner, chunks, batch_size=1024, lookahead=65536, start: input_cursor=None):
+        start = start or input_cursor() # Where the first chunk is located in the input
+        self.scanner = scanner
+        self.token_types = scanner.token_types
+        self.named_groups = scanner.named_groups
+        self.chunks = iter(chunks)
+        self.exhausted = False # Whether all chunks have been read
+        self.finished = False # Whether all tokens have been stored
+        self.lookahead = lookahead if scanner.streaming else math.inf # Without prefix patterns, all input is read first
+        self.text = "" # The input from "text_offset" onwards
+        self.text_offset = start.index - 1
+        self.position = start.index - 1 # Where to continue tokenizing
+        self.line = start.line
+        self.column = start.column
+        self.offset = 0 # Index of the first stored token
+        self.batch_size = batch_size
+        self.frames = None
+        self.type_ids = array("I") # Id of the token type in the scanner (see "Scanner.token_types")
+        self.spaces = array("q") # Offset of the whitespaces before each token
+        self.starts = array("q")
+        self.ends = array("q")
+        self.lines = array("l")
+        self.columns = array("l")
+        self.end_lines = array("l")
+        self.end_columns = array("l")
+        self.literal_ids = array("I") # Number of the literal value of each token (see "Scanner"), 0 for other values
+        self.tokens = [] # Token objects that were created so far (or None)
+        self.profiler = None
+    def get(self, index):
+        number = index - self.offset
+        while number >= len(self.type_ids):
+            if not self.fill(index):
+                return None
+            number = index - self.offset
+        return self.tokens[number] or self.make_token(number)
+    def type_at(self, index):
+        number = index - self.offset
+        while number >= len(self.type_ids):
+            if not self.fill(index):
+                return None
+            number = index - self.offset
+        return self.token_types[self.type_ids[number]]
+    def value_at(self, index):
+        if self.named_groups[self.type_at(index)]: # The value might be overridden by a named group
+            return self.get(index).value
+        number = index - self.offset
+        return self.text[self.starts[number] - self.text_offset:self.ends[number] - self.text_offset]
+    def literal_at(self, index):
+        if self.named_groups[self.type_at(index)]:
+            return self.get(index).value
+        return self.scanner.literal_values[self.literal_ids[index - self.offset]]
+    def has_literal(self, index, value):
+        # Literal values of the grammar are compared by their numbers, without slicing the input
+        self.type_at(index) # Tokenize up to it
+        number = index - self.offset
+        table = self.scanner.literal_tables[self.type_ids[number]]
+        literal = None if table is None else table.get(value, None)
+        if literal is None: # No literal value of the grammar (or the token type has named groups)
+            return self.value_at(index) == value
+        return self.literal_ids[number] == literal
+    def slice(self, start, end):
+        while end - self.offset > len(self.type_ids) and self.fill(start):
+            pass
+        first, last = start - self.offset, end - self.offset
+        tokens = self.tokens[first:last]
+        if None in tokens: # Only create the token objects that weren't taken yet
+            make_token = self.make_token
+            tokens = [token or make_token(first + number) for number, token in enumerate(tokens)]
+        return tokens
+    def make_token(self, number):
+        text, text_offset = self.text, self.text_offset
+        token_type = self.token_types[self.type_ids[number]]
+        start, end = self.starts[number], self.ends[number]
+        token = self.tokens[number] = InputToken(
+            token_type
+            , text[start - text_offset:end - text_offset]
+            , text[self.spaces[number] - text_offset:start - text_offset] if self.scanner.whitespace else None
+            , input_cursor(start + 1, self.lines[number], self.columns[number])
+            , input_cursor(end + 1, self.end_lines[number], self.end_columns[number])
+        )
+        named_groups = self.named_groups[token_type]
+        if named_groups:
+            match = self.scanner.match(text, start - text_offset)[1]
+            token.set_groups({name: match.group(group) for name, group in named_groups})
+        return token
+    def fill(self, index=None):
+        if self.finished:
+            return False
+        if self.frames is not None and index is not None: # The input before the first kept token is dropped with the next chunk
+            self.release(oldest_index(self.frames, index))
+        scanner = self.scanner
+        whitespace, pattern = scanner.whitespace, scanner.pattern # The pattern is None, if token types are matched separately
+        text, text_offset = self.text, self.text_offset
+        position = self.position - text_offset
+        line, column = self.line, self.column
+        count, read_more = 0, False
+        profiler = self.profiler
+        if profiler is not None:
+            time = perf_counter()
+        type_ids, spaces, starts, ends = self.type_ids, self.spaces, self.starts, self.ends
+        lines, columns, end_lines, end_columns = self.lines, self.columns, self.end_lines, self.end_columns
+        literal_ids, literal_tables = self.literal_ids, self.scanner.literal_tables
+        while count < self.batch_size:
+
+            # Buffer enough input to match the next token in one go (and more, if a match reached the end of the buffer)
+            if not self.exhausted and (read_more or len(text) - position < self.lookahead):
+                keep = (self.spaces[0] if self.spaces else text_offset + position) - text_offset
+                parts = [text[keep:]]
+                size = len(text) - position # Input that is buffered ahead
+                while read_more or size < self.lookahead:
+                    chunk = next(self.chunks, None)
+                    if chunk is None:
+                        self.exhausted = True
+                        break
+                    parts.append(chunk)
+                    size += len(chunk)
+                    read_more = False
+                text, text_offset, position = "".join(parts), text_offset + keep, position - keep
+
+            # Skip whitespaces and match the next token
+            start = whitespace.match(text, position).end() if whitespace else position
+            if start == len(text):
+                if self.exhausted:
+                    self.finished = True
+                    break
+                read_more = True
+                continue
+            if pattern is not None:
+                match = pattern.match(text, start)
+                kind = match and match.lastindex
+            else:
+                kind, match = scanner.match(text, start)
+            if not self.exhausted:
+                if match is None or match.end() == len(text):
+                    read_more = True # The token might continue in the next chunk
+                    continue
+                if scanner.continues(text, start, kind):
+                    read_more = True # A token type listed before it might match with more input (see "Scanner.prefix_pattern")
+                    continue
+            if match is None:
+                raise Exception("No Token matched at: %.7s..." % text[start:start+7])
+
+            # Store the token
+            end = match.end()
+            type_ids.append(kind)
+            table = literal_tables[kind]
+            literal_ids.append(0 if table is None else table.get(text[start:end], 0))
+            spaces.append(text_offset + position)
+            starts.append(text_offset + start)
+            ends.append(text_offset + end)
+            if start != position:
+                line, column = advance_line_column(text, position, start, line, column)
+            lines.append(line)
+            columns.append(column)
+            line, column = advance_line_column(text, start, end, line, column)
+            end_lines.append(line)
+            end_columns.append(column)
+            position = end
+            count += 1
+            if profiler is not None:
+                time, previous_time = perf_counter(), time
+                profiler.token(self.token_types[kind], time - previous_time)
+        self.tokens.extend([None] * count)
+        self.text, self.text_offset, self.position = text, text_offset, text_offset + position
+        self.line, self.column = line, column
+        return count > 0
+    def release(self, index):
+        count = index - self.offset
+        if count > 0:
+            for values in (self.type_ids, self.spaces, self.starts, self.ends, self.lines, self.columns, self.end_lines, self.end_columns, self.literal_ids, self.tokens):
+                del values[:count]
+            self.offset = index
+
+# Packrat Cache (memoizes the outcome of a rule reference at a token index)
+# With a "maxsize", the least recently used entries are evicted
+class PackratCache:
+    chains = False # Whether the outcomes of tail references (see "Chain") are memoized as well, keyed by (rule path, tail)
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self.entries = {} if maxsize is None else OrderedDict() # Least recently used first
+        self.hits = 0
+        self.misses = 0
+    def __len__(self):
+        return len(self.entries)
+    def get(self, rule_path, index):
+        entry = self.entries.get((rule_path, index), None)
+        if entry is None:
+            self.misses += 1
         else:
-            raise Exception("No Token matched at: %.7s..." % input)
-        if language.strip_whitespaces:
-            new_input = input.lstrip(language.strip_whitespaces)
-            space_before, input, position = take_from_input(input, len(input)-len(new_input), position)
-    return result
+            self.hits += 1
+            if self.maxsize is not None:
+                self.entries.move_to_end((rule_path, index))
+        return entry
+    def put(self, rule_path, index, result, success, end_index):
+        if self.maxsize is not None:
+            if self.maxsize <= 0:
+                return
+            while len(self.entries) >= self.maxsize:
+                self.entries.popitem(last=False) # Evict the least recently used entry
+        self.entries[(rule_path, index)] = (result, success, end_index)
+    def clear(self):
+        self.entries.clear()
+
+# Parse Budget (bounds the work of one parse, e.g. of untrusted inputs that make the parser backtrack a lot)
+# Raised, when a parse exceeded its budget. "position" is the "input_cursor" of the furthest token a rule was
+# attempted at (or None at the end of the input)
+class ParseLimitExceeded(Exception):
+    def __init__(self, limit, attempts, backtracks, elapsed, index, token):
+        self.limit = limit # "attempts" or "timeout"
+        self.attempts = attempts # The number of rules attempted so far
+        self.backtracks = backtracks # The number of these attempts that failed
+        self.elapsed = elapsed # Seconds since the parse started
+        self.index = index # The index of the furthest token
+        self.token = token
+        self.position = token.position if token is not None else None
+        super().__init__("Parsing exceeded its %s limit after %d rule attempts (%d backtracks) and %.3f seconds, furthest at %s" % (
+            limit, attempts, backtracks, elapsed
+            , "line %d, column %d" % (self.position.line, self.position.column) if token is not None else "the end of the input"
+        ))
+    def __reduce__(self): # Pickled with the arguments (e.g. when raised in a "parse_many" worker), not with the message
+        return type(self), (self.limit, self.attempts, self.backtracks, self.elapsed, self.index, self.token)
+class Budget:
+    def __init__(self, max_attempts=None, timeout=None):
+        self.max_attempts = max_attempts # Of rules
+        self.start = monotonic()
+        self.deadline = None if timeout is None else self.start + timeout # Checked every 256 rule attempts
+        self.attempts = 0
+        self.backtracks = 0
+        self.furthest = 0 # The furthest token index a rule was attempted at
+        self.furthest_token = None # Kept, as the token buffer might release it
+    def attempt(self, state):
+        if state.current_index > self.furthest or self.attempts == 0:
+            self.furthest = state.current_index
+            self.furthest_token = state.current_token
+        if self.max_attempts is not None and self.attempts >= self.max_attempts:
+            self.exceeded(state, "attempts")
+        self.attempts += 1
+        if self.deadline is not None and not self.attempts & 255 and monotonic() > self.deadline:
+            self.exceeded(state, "timeout")
+    def exceeded(self, state, limit):
+        raise ParseLimitExceeded(limit, self.attempts, self.backtracks, monotonic() - self.start, self.furthest, self.furthest_token)
 
 # Parser State
 class ParserState:
-    def __init__(self, token_list, current_index=0):
-        self.token_list = token_list
+    def __init__(self, token_list, current_index=0, cache=None, profiler=None, events=False, budget=None):
+        self.token_list = token_list if isinstance(token_list, TokenBuffer) else TokenBuffer(token_list)
         self.current_index = current_index
+        self.cache = cache
+        self.profiler = profiler
+        self.events = events # Whether to only record the matched rules instead of building results (see "parse_events")
+        self.budget = budget
     @property
     def current_token(self):
-        return self.token_list[self.current_index] if self.current_index < len(self.token_list) else None
+        return self.token_list.get(self.current_index)
+    def peek(self, requirement):
+        # The current token, if it matches the TokenType or InputToken "requirement" (without taking it), otherwise None
+        token_type = self.token_list.type_at(self.current_index)
+        if isinstance(requirement, TokenType):
+            if token_type != requirement:
+                return None
+        elif token_type == requirement.type:
+            if isinstance(requirement.value, str):
+                if not self.token_list.has_literal(self.current_index, requirement.value):
+                    return None
+            elif not (isinstance(requirement.value, re.Pattern) and requirement.value.match(self.token_list.value_at(self.current_index))):
+                return None
+        else:
+            return None
+        return self.token_list.get(self.current_index)
     def take_type(self, token_type: TokenType):
-        current_token = self.current_token
-        if current_token and current_token.type == token_type:
-            self.current_index += 1
-            return current_token, True
-        return None, False
+        token = self.peek(token_type)
+        if token is None:
+            return None, False
+        self.current_index += 1
+        return token, True
     def take_token(self, token: InputToken):
-        current_token, success = self.take_type(token.type)
-        if success:
-            if isinstance(token.value, str) and current_token.value == token.value:
-                return current_token, True
-            elif isinstance(token.value, re.Pattern) and token.value.match(current_token.value):
-                return current_token, True
-            else:
-                self.current_index -= 1
-        return None, False
+        return self.take_type(token)
+    def advanced(self):
+        # A fork behind the current token
+        return ParserState(self.token_list, self.current_index + 1, self.cache, self.profiler, self.events, self.budget)
     def fork(self):
-        return ParserState(self.token_list, self.current_index)
+        return ParserState(self.token_list, self.current_index, self.cache, self.profiler, self.events, self.budget)
     def delta_tokens(self, other_state):
-        return self.token_list[self.current_index:other_state.current_index]
+        return self.token_list.slice(self.current_index, other_state.current_index)
 
 # Parser
-def parse_ex(language: Language, rule_path: str, state_reference):
-    class Step:
-        def __init__(self, state_reference, requirement=None, destination=None, result=None):
-            self.state_reference = state_reference
-            self.requirement = requirement
-            self.destination = destination
-            self.result = result
-    history = [Step(state_reference, None, None)] # In order to enable recursion to reference the last step
-    identification = None
-
-    # Determine viable rules
-    viable_rules = [(key, rule) for key, rule in language.rules.items() if key.startswith(rule_path)]
-
-    # See, if any rule matches
-    for key, rule in viable_rules:
-
-        # rule is "(target, steps...)" or "[steps...]" just "target"
-        if isinstance(rule, list):
-            target = language.default_target
-            steps = rule
-        elif isinstance(rule, tuple):
-            target, *steps = rule
-        else:
-            target = rule
-            steps = []
-        identification = key
+class Step:
+    def __init__(self, state_reference, requirement=None, destinations=(), result=None):
+        self.state_reference = state_reference
+        self.requirement = requirement
+        self.destinations = destinations
+        self.result = result
 
-        for step_number, step in enumerate(steps, 1):
+# The outcome of a rule referenced by the last step of a rule of the same kind of chain (see "CompiledRule.chain").
+# Instead of building a list or dictionary, only to have it copied into the result of the referencing rule (and
+# that one into the result of its own referencing rule, and so on), the referencing rule adds the steps to its own result.
+# This way, collecting "n" elements with right recursion takes linear instead of quadratic time.
+class Chain:
+    def __init__(self, rule: CompiledRule, history):
+        self.rule = rule
+        self.history = history
 
-            # A step can be a tuple "(step, destination)"
-            destination = None
-            if isinstance(step, tuple):
-                step, destination = step[0], step[1]
+# A matched rule, when only events are reported (see "parse_events"): its first and last token and the results of its
+# steps (tokens and further matches). The tokens are taken from the children, as the token buffer might have released them.
+class RuleMatch:
+    __slots__ = ("rule", "start_token", "end_token", "children")
+    def __init__(self, rule: CompiledRule, children):
+        self.rule = rule
+        self.start_token = self.end_token = None
+        for child in children:
+            token = child.start_token if isinstance(child, RuleMatch) else child
+            if token is not None:
+                self.start_token = token
+                break
+        for child in reversed(children):
+            token = child.end_token if isinstance(child, RuleMatch) else child
+            if token is not None:
+                self.end_token = token
+                break
+        self.children = children
+def finish_rule(rule: CompiledRule, rule_path: str, history, state_reference, tail=None):
+    del history[len(rule.steps) + 1:] # Steps of previous rules that were kept for reuse, but don't belong to this rule
+    if state_reference[0].events:
+        state_reference[0] = history[-1].state_reference[0]
+        return RuleMatch(rule, tuple([step.result for step in history[1:]]))
+    if tail is not None and rule.chain is tail: # The referencing rule builds the result
+        state_reference[0] = history[-1].state_reference[0]
+        return Chain(rule, history)
+    result = {None:[]}
+    owned = {None} # The keys of lists that were created for this result and may be extended in place
+    chain = Chain(rule, history)
+    while chain is not None:
+        steps, step_rule, chain = chain.history, chain.rule, None
+        for step in steps[1:]:
+            if isinstance(step.result, Chain): # Continue with the steps of the chained rule (as if appending its result)
+                chain = step.result
+                break
+            value = step.result # The steps of memoized chains are reused, so they are left unchanged
+            for destination, transformer in step.destinations:
 
-            # The step can actually be a list "(step-option-1, step-option-2, etc.)"
-            for option in ensure_list(step):
+                # Apply the transformer to result depending on the type of transformer
+                if isinstance(transformer, str):
+                    if isinstance(value, dict):
+                        value = value.get(transformer, None)
+                    elif hasattr(value, transformer):
+                        value = getattr(value, transformer)
+                elif callable(transformer):
+                    value = transformer(value)
 
-                # Each step option can itself be a tuple "(step, destination-override)"
-                actual_destination = destination
-                if isinstance(option, tuple):
-                    option, actual_destination = option[0], option[1] # You can also specify a destination per option
+                # Send to destination
+                if destination == None:
+                    set_or_append(result, None, value, owned)
+                elif destination == "":
+                    if isinstance(value, dict):
+                        for key, item in value.items():
+                            set_or_append(result, key, item, owned)
+                    else:
+                        raise Exception("Cannot insert non-dictionary into current object at rule [%s]" % step_rule.key)
+                elif isinstance(destination, int): # Take the nth result in the 'None' entry
+                    set_or_append(result, result[None][destination], value, owned)
+                elif destination != False:
+                    set_or_append(result, destination, value, owned)
+
+    # Enrich with debug information?
+    if rule.make_input_tokens_available:
+        result["input_tokens"] = state_reference[0].delta_tokens( history[-1].state_reference[0] )
+    if rule.make_grammar_rule_available:
+        result["grammar_rule"] = (rule_path, rule.key)
+
+    # Override the parser state of the parent function, so it knows where to continue parsing
+    state_reference[0] = history[-1].state_reference[0]
+    return rule.build(result)
+def parse_ex(language: Language, rule_path: str, state_reference, tail=None):
+    state = state_reference[0]
+
+    # Reuse the memoized outcome of this rule reference at the current token index (in this frame, so every rule
+    # reference takes one Python frame, as without a cache). Chains are no results on their own, unless the cache keeps them.
+    cache = state.cache
+    key = None
+    if cache is not None and (tail is None or cache.chains):
+        key = rule_path if tail is None else (rule_path, tail)
+        entry = cache.get(key, state.current_index)
+        if entry is not None:
+            result, success, end_index = entry
+            if success:
+                state_reference[0] = state.fork()
+                state_reference[0].current_index = end_index
+            return result, success
+    profiler = state.profiler
+    budget = state.budget
+    spare = None # The state reference of a failed rule reference, which can be reused for the next one
+    frames = state.token_list.frames # Where the token buffer sees, which tokens it can release (see "oldest_index")
+    frame = Frame(rule_path, state_reference, language.candidates(rule_path, state.token_list, state.current_index), tail)
+    history = frame.history # In order to enable recursion to reference the last step
+    frames.append(frame)
+
+    # See, if any rule matches (that can start with the current token), the frame follows where we are
+    for frame.rule_number, rule in enumerate(frame.rules):
+        if profiler is not None:
+            profiler.enter(rule.key)
+        if budget is not None:
+            budget.attempt(state)
+        if rule.operators is not None: # Operator tables match their operands one by one
+            result, success = parse_operators(language, rule, rule_path, state_reference)
+            if profiler is not None:
+                profiler.exit(success, state_reference[0].current_index - state.current_index)
+            if success:
+                frames.pop()
+                if key is not None:
+                    cache.put(key, state.current_index, result, True, state_reference[0].current_index)
+                return result, True
+            if budget is not None:
+                budget.backtracks += 1
+            continue
+        for step_number, options in enumerate(rule.steps, 1):
+            frame.step_number = step_number - 1
+            for frame.option_number, option in enumerate(options):
+                requirement = option.requirement
 
                 # Determine, whether we have a saved history of the current step being matched
-                if len(history) > step_number and history[step_number].requirement is option:
-                    history[step_number].destination = actual_destination # The destination might change, but we don't need to reexecute
-                else:
-                    # Rewrite history from the present forwards
-                    history = [
-                        *history[:step_number+1] # history before this step
-                        , Step([history[-1].state_reference[0].fork()], option, actual_destination)
-                    ]
+                if len(history) > step_number and history[step_number].requirement is requirement:
+                    history[step_number].destinations = option.destinations # The destination might change, but we don't need to reexecute
+                    break
 
-                    # Match according to type of requirement
-                    if isinstance(option, TokenType): # Requires a token of the supplied type
-                        history[-1].result, success = history[-1].state_reference[0].take_type(option)
-                    elif isinstance(option, InputToken): # Requires a token with the supplied type
-                        history[-1].result, success = history[-1].state_reference[0].take_token(option)
-                    elif isinstance(option, str): # Strings require matching of other rules
-                        history[-1].result, success = parse_ex(language, option, history[-1].state_reference)
-                    else:
-                        raise Exception("Unknown requirement in rule [%s] of type: %s" % (key, type(option)))
+                # Rewrite history from the present forwards
+                del history[step_number:]
+                previous = history[-1].state_reference[0]
 
-                    # The option did not match
+                # Match according to type of requirement (only successful steps are added to the history)
+                if isinstance(requirement, (TokenType, InputToken)): # Requires a token of the supplied type (and value)
+                    result = previous.peek(requirement)
+                    if result is None:
+                        continue
+                    history.append(Step([previous.advanced()], requirement, option.destinations, result))
+                elif isinstance(requirement, str): # Strings require matching of other rules
+                    if spare is None:
+                        spare = [previous.fork()]
+                    else:
+                        spare[0].current_index = previous.current_index
+                    result, success = parse_ex(language, requirement, spare, option.tail)
                     if not success:
-                        history.pop() # Destroy the hypothetical step in history
                         continue
+                    history.append(Step(spare, requirement, option.destinations, result))
+                    spare = None
+                else:
+                    raise Exception("Unknown requirement in rule [%s] of type: %s" % (rule.key, type(requirement)))
                 break
 
             else:
                 break # If we didn't find one (no inner "break" was activated)
 
         else: # The whole rule matched!
+            result = finish_rule(rule, rule_path, history, state_reference, tail)
+            frames.pop()
+            if profiler is not None:
+                profiler.exit(True, state_reference[0].current_index - state.current_index)
+            if key is not None:
+                cache.put(key, state.current_index, result, True, state_reference[0].current_index)
+            return result, True
 
-            result = {None:[]}
-            for step in history[1:]:
-                for destination in ensure_list(step.destination):
-
-                    # The destination can actually be a tuple "(destination, transformer)"
-                    transformer = None
-                    if isinstance(destination, tuple):
-                        destination, transformer = destination[0], destination[1]
-
-                        # Apply the transformer to result depending on the type of transformer
-                        if isinstance(transformer, str):
-                            if isinstance(step.result, dict):
-                                step.result = step.result.get(transformer, None)
-                            elif hasattr(step.result, transformer):
-                                step.result = getattr(step.result, transformer)
-                        elif callable(transformer):
-                            step.result = transformer(step.result)
-
-                    # Send to destination
-                    if destination == None:
-                        set_or_append(result, None, step.result)
-                    elif destination == "":
-                        if isinstance(step.result, dict):
-                            for key, value in step.result.items():
-                                set_or_append(result, key, value)
-                        else:
-                            raise Exception("Cannot insert non-dictionary into current object at rule [%s]" % key )
-                    elif isinstance(destination, int): # Take the nth result in the 'None' entry
-                        set_or_append(result, result[None][destination], step.result)
-                    elif destination != False:
-                        set_or_append(result, destination, step.result)
-
-            # Enrich with debug information?
-            def check_entry(entry):
-                if target == entry or isinstance(target, entry):
-                    return True
-                return issubclass(target, entry) if isclass(target) and isclass(entry) else False
-            if True in [check_entry(entry) for entry in language.make_input_tokens_available]:
-                result["input_tokens"] = state_reference[0].delta_tokens( history[-1].state_reference[0] )
-            if True in [check_entry(entry) for entry in language.make_grammar_rule_available]:
-                result["grammar_rule"] = (rule_path, identification)
-
-            # Override the parser state of the parent function, so it knows where to continue parsing
-            state_reference[0] = history[-1].state_reference[0]
-
-            # a) Return the dictionary
-            if isinstance(target, dict):
-                if result[None] == [] or (None not in target): # If we didn't collect elements without destination, remove the key 'None'
-                    return {key: value for key, value in result.items() if key is not None}, True
-                else:
-                    return result, True
-
-            # b) Return the results that didn't have an explicit destination (as list)
-            elif target == []:
-                return result[None], True
+        if profiler is not None:
+            profiler.exit(False)
+        if budget is not None:
+            budget.backtracks += 1
 
-            # c) Return the results that didn't have an explicit destination (converted to string and concatenated)
-            elif target == "":
-                return "".join([str(value) for value in result[None]]), True
+    frames.pop()
+    if key is not None:
+        cache.put(key, state.current_index, None, False, state_reference[0].current_index)
+    return None, False
 
-            # d) Return the field with the supplied name
-            elif isinstance(target, str):
-                return result.get(target, None), True
+# Operator Tables (precedence climbing, with one rule reference per operand)
+# Yields "(operand rule path, token index)" for every operand to match and expects "(result, end index)" or None back.
+# Returns "(result, end index)" of the whole expression or None.
+def match_operators(rule: CompiledRule, rule_path: str, token_list: TokenBuffer, index, events=False):
+    operators = rule.operators
+    operands = [] # [result, start index, end index] of all operands that are not part of an operation yet
+    pending = [] # (operator, token index) of all prefix and binary operators that are not applied yet
+    tokens = [] # The tokens from "index" on, as far as operations were built (shared by their "input_tokens")
+    def build(operator, fields, start, end):
+        if events: # The fields are in the order of the input
+            return RuleMatch(operator.rule, tuple(fields.values()))
+        result = {None: [], **fields}
+        if operator.rule.make_input_tokens_available:
+            if end - index > len(tokens):
+                tokens.extend(token_list.slice(index + len(tokens), end))
+            result["input_tokens"] = TokenSpan(tokens, start - index, end - index)
+        if operator.rule.make_grammar_rule_available:
+            result["grammar_rule"] = (rule_path, rule.key)
+        return operator.rule.build(result)
+    def reduce():
+        operator, token_index = pending.pop()
+        if operator.kind == "prefix":
+            operand, _, end = operands.pop()
+            operands.append([build(operator, {"type": token_list.get(token_index), "operand": operand}, token_index, end), token_index, end])
+        else:
+            right, _, end = operands.pop()
+            left, start, _ = operands.pop()
+            operands.append([build(operator, {"left": left, "type": token_list.get(token_index), "right": right}, start, end), start, end])
 
-            # e) Construct an object of the supplied class and pass the dict as named arguments to constructor
-            elif isclass(target) and "__init__" in vars(target):
-                return target(*result[None], **{key: value for key, value in result.items() if key is not None}), True
+    position = index
+    while True:
+        # An operand, optionally preceded by prefix operators
+        prefixes = len(pending)
+        while (operator := find_operator(operators["prefix"], token_list, position)) is not None:
+            pending.append((operator, position))
+            position += 1
+        while True:
+            outcome = yield rule.operand, position
+            if outcome is not None or len(pending) == prefixes:
+                break
+            position = pending.pop()[1] # Maybe the operand starts with the last prefix operator
+        if outcome is None:
+            if not operands:
+                return None
+            position = pending.pop()[1] # The expression ends before the last binary operator
+            break
+        operands.append([outcome[0], position, outcome[1]])
+        position = outcome[1]
 
-            # f) Create an object of the supplied class and let the dictionary set its attributes
-            elif isclass(target):
-                object_result = target()
-                for key, value in result.items():
-                    if key:
-                        setattr(object_result, key, value)
-                return object_result, True
+        # A postfix operator applies to the operand right away (at most one per operand, like "23." "++" in a grammar rule)
+        if (operator := find_operator(operators["postfix"], token_list, position)) is not None:
+            while pending and pending[-1][0].precedence > operator.precedence:
+                reduce()
+            operand, start, _ = operands.pop()
+            operands.append([build(operator, {"operand": operand, "type": token_list.get(position)}, start, position + 1), start, position + 1])
+            position += 1
 
-            # g) Call a function with the resulting dictionary as named parameters
-            elif callable(target):
-                return target(*result[None], **{key: value for key, value in result.items() if key is not None}), True
+        # A binary operator continues the expression
+        operator = find_operator(operators["binary"], token_list, position)
+        if operator is None:
+            break
+        while pending and (pending[-1][0].precedence > operator.precedence or pending[-1][0].precedence == operator.precedence and operator.kind == "left"):
+            reduce()
+        pending.append((operator, position))
+        position += 1
 
-            # h) return just the target
-            elif target is not None:
-                return target, True
+    while pending:
+        reduce()
+    return operands[0][0], position
 
-            # h) Return the result or the results that didn't have an explicit destination (list or plain value)
-            return result[None][0] if len(result[None]) == 1 else result[None] or None, True
+# Token Span (the "input_tokens" of an operation of an operator table)
+# A read-only view of the tokens "start" to "end" of a list. All operations of one expression share the same list,
+# so nested operations don't slice their tokens once per nesting level
+class TokenSpan(Sequence):
+    __slots__ = ("tokens", "start", "end")
+    def __init__(self, tokens, start, end):
+        self.tokens = tokens
+        self.start = start
+        self.end = end
+    def __len__(self):
+        return self.end - self.start
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.tokens[self.start:self.end][key]
+        return self.tokens[range(self.start, self.end)[key]]
+    def __iter__(self):
+        return islice(self.tokens, self.start, self.end)
+    def __eq__(self, other):
+        if isinstance(other, (TokenSpan, list, tuple)):
+            return len(self) == len(other) and all(token == other_token for token, other_token in zip(self, other))
+        return NotImplemented
+    __hash__ = None
+    def __repr__(self):
+        return repr(list(self))
+def find_operator(operators, token_list: TokenBuffer, index):
+    if not operators:
+        return None
+    token_type = token_list.type_at(index)
+    for operator in operators:
+        requirement = operator.requirement
+        if isinstance(requirement, TokenType):
+            if token_type == requirement:
+                return operator
+        elif token_type == requirement.type:
+            if isinstance(requirement.value, str):
+                if token_list.has_literal(index, requirement.value):
+                    return operator
+            elif isinstance(requirement.value, re.Pattern) and requirement.value.match(token_list.value_at(index)):
+                return operator
+    return None
+def parse_operators(language: Language, rule: CompiledRule, rule_path: str, state_reference):
+    state = state_reference[0]
+    matcher = match_operators(rule, rule_path, state.token_list, state.current_index, state.events)
+    outcome = None
+    try:
+        while True:
+            operand_path, position = matcher.send(outcome)
+            operand_state = [state.fork()]
+            operand_state[0].current_index = position
+            result, success = parse_ex(language, operand_path, operand_state)
+            outcome = (result, operand_state[0].current_index) if success else None
+    except StopIteration as stop:
+        outcome = stop.value
+    if outcome is None:
+        return None, False
+    state_reference[0] = state.fork()
+    state_reference[0].current_index = outcome[1]
+    return outcome[0], True
 
-    return None, False
+# Iterative Parser (same results as "parse_ex", but keeps its own stack instead of recursing per rule reference)
+# The recursive parser uses frames, too, so the token buffer sees where both are (see "oldest_index")
+class Frame:
+    def __init__(self, rule_path, state_reference, rules, tail=None):
+        self.rule_path = rule_path
+        self.state_reference = state_reference
+        self.tail = tail # The kind of chain the referencing rule builds (see "Chain")
+        self.start_index = state_reference[0].current_index
+        self.rules = rules
+        self.history = [Step(state_reference)]
+        self.rule_number = self.step_number = self.option_number = 0 # Where to continue matching
+        self.profiled_rule_number = -1 # The rule number, whose attempt was reported to the profiler and budget
+        self.matcher = None # The "match_operators" generator of the current operator table
+        self.operand_state_reference = None # The state of the operand it is currently matching
+        self.spare = None # The state reference of the rule reference in progress or of a failed one, which can be reused
+        self.bound_key = self.bound = None # The oldest index from here outwards, in the state it was computed for
+def parse_iterative(language: Language, rule_path: str, state_reference, tail=None):
+    cache = state_reference[0].cache
+    stack = state_reference[0].token_list.frames
+    base = len(stack) # The frames of an enclosing parse (e.g. while a cache parses a rule reference again, see "incremental")
+    call = (rule_path, state_reference, tail) # The rule reference to enter next
+    outcome = None # The outcome of the rule reference that finished last
+    while True:
+        if call is not None:
+            rule_path, state_reference, tail = call
+            call = None
 
-# Use this
-def parse(language: Language, input: str):
-    parser_state = [ParserState(tokenize(language, input))]
-    result = parse_ex(language, language.root_rule, parser_state)[0]
-    return None if parser_state[0].current_token else result
+            # Reuse the memoized outcome of this rule reference at the current token index (chains only, if the cache keeps them)
+            memoized = cache is not None and (tail is None or cache.chains)
+            entry = cache.get(rule_path if tail is None else (rule_path, tail), state_reference[0].current_index) if memoized else None
+            if entry is not None:
+                result, success, end_index = entry
+                if success:
+                    state_reference[0] = state_reference[0].fork()
+                    state_reference[0].current_index = end_index
+                outcome = result, success
+                if len(stack) == base:
+                    return outcome
+            else:
+                state = state_reference[0]
+                stack.append(Frame(rule_path, state_reference, language.candidates(rule_path, state.token_list, state.current_index), tail))
 
-# AST Visualizer
-def print_ast(value, indent=None):
-    if not indent:
-        print("<root> = ", end="")
-        indent = 0
-    if isinstance(value, InputToken):
-        print( "[" + str(value.type) + "] = '" + value.value + "'")
-    elif isinstance(value, AST):
-        if type(value) != AST:
-            if hasattr(value, "grammar_rule"):
-                print( value.__class__.__name__ + " <- [" + value.grammar_rule[1] + '] <- "' + value.grammar_rule[0] + '"')
+        # Continue matching the innermost rule reference
+        frame = stack[-1]
+        call, done = advance_frame(frame, outcome)
+        outcome = None
+        if done is not None:
+            stack.pop()
+            if cache is not None and (frame.tail is None or cache.chains):
+                key = frame.rule_path if frame.tail is None else (frame.rule_path, frame.tail)
+                cache.put(key, frame.start_index, *done, frame.state_reference[0].current_index)
+            if len(stack) == base:
+                return done
+            outcome = done
+def advance_frame(frame: Frame, outcome):
+    history = frame.history
+    profiler = frame.state_reference[0].profiler
+    budget = frame.state_reference[0].budget
+    monitored = profiler is not None or budget is not None
+    while frame.rule_number < len(frame.rules):
+        rule = frame.rules[frame.rule_number]
+        if monitored and frame.profiled_rule_number != frame.rule_number:
+            frame.profiled_rule_number = frame.rule_number
+            if profiler is not None:
+                profiler.enter(rule.key)
+            if budget is not None:
+                budget.attempt(frame.state_reference[0])
+        if rule.operators is not None: # Operator tables match their operands one by one
+            state = frame.state_reference[0]
+            if frame.matcher is None:
+                frame.matcher = match_operators(rule, frame.rule_path, state.token_list, state.current_index, state.events)
+            elif outcome[1]:
+                outcome = outcome[0], frame.operand_state_reference[0].current_index
             else:
-                print( value.__class__.__name__)
-        elif hasattr(value, "grammar_rule"):
-            if value.grammar_rule[0] == value.grammar_rule[1]:
-                print( '[' + value.grammar_rule[0] + ']')
+                outcome = None
+            try:
+                operand_path, position = frame.matcher.send(outcome)
+                frame.operand_state_reference = [state.fork()]
+                frame.operand_state_reference[0].current_index = position
+                return (operand_path, frame.operand_state_reference, None), None
+            except StopIteration as stop:
+                frame.matcher = frame.operand_state_reference = outcome = None
+                if stop.value is not None:
+                    frame.state_reference[0] = state.fork()
+                    frame.state_reference[0].current_index = stop.value[1]
+                    if profiler is not None:
+                        profiler.exit(True, stop.value[1] - frame.start_index)
+                    return None, (stop.value[0], True)
+            if profiler is not None:
+                profiler.exit(False)
+            if budget is not None:
+                budget.backtracks += 1
+            frame.rule_number += 1
+            continue
+        while frame.step_number < len(rule.steps):
+            options = rule.steps[frame.step_number]
+            step_number = frame.step_number + 1
+            while frame.option_number < len(options):
+                option = options[frame.option_number]
+                requirement = option.requirement
+                if outcome is not None: # The referenced rule of the current option finished
+                    result, success = outcome
+                    outcome = None
+                    if success:
+                        history.append(Step(frame.spare, requirement, option.destinations, result))
+                        frame.spare = None
+                        break
+                else:
+                    # Determine, whether we have a saved history of the current step being matched
+                    if len(history) > step_number and history[step_number].requirement is requirement:
+                        history[step_number].destinations = option.destinations # The destination might change, but we don't need to reexecute
+                        break
+
+                    # Rewrite history from the present forwards
+                    del history[step_number:]
+                    previous = history[-1].state_reference[0]
+
+                    # Match according to type of requirement (only successful steps are added to the history)
+                    if isinstance(requirement, (TokenType, InputToken)): # Requires a token of the supplied type (and value)
+                        result = previous.peek(requirement)
+                        if result is not None:
+                            history.append(Step([previous.advanced()], requirement, option.destinations, result))
+                            break
+                    elif isinstance(requirement, str): # Strings require matching of other rules
+                        if frame.spare is None:
+                            frame.spare = [previous.fork()]
+                        else:
+                            frame.spare[0].current_index = previous.current_index
+                        return (requirement, frame.spare, option.tail), None
+                    else:
+                        raise Exception("Unknown requirement in rule [%s] of type: %s" % (rule.key, type(requirement)))
+
+                # The option did not match
+                frame.option_number += 1
             else:
-                print( '[' + value.grammar_rule[0] + ' > ' + value.grammar_rule[1] + ']')
+                break # No option of this step matched
+            frame.step_number += 1
+            frame.option_number = 0
+        else: # The whole rule matched!
+            if profiler is None:
+                return None, (finish_rule(rule, frame.rule_path, history, frame.state_reference, frame.tail), True)
+            result = finish_rule(rule, frame.rule_path, history, frame.state_reference, frame.tail)
+            profiler.exit(True, frame.state_reference[0].current_index - frame.start_index)
+            return None, (result, True)
+        if profiler is not None:
+            profiler.exit(False)
+        if budget is not None:
+            budget.backtracks += 1
+        frame.rule_number += 1
+        frame.step_number = frame.option_number = 0
+    return None, (None, False)
+
+# Token Release
+# The token buffer forgets the tokens before the oldest index, that a rule being parsed might still read. A rule returns
+# to the start of its current step for its next option. If it fails, the next candidate rules reuse the steps they share
+# with it (see "parse_ex") and continue behind them - and if such a candidate consists only of shared steps, it matches
+# for sure, so no further candidates are tried. Rules with steps that always match (see "Language.find_certain_options")
+# can't fail anymore, once the rule they are waiting for matches for sure.
+def oldest_index(frames, index):
+    # Goes outwards from the innermost frame, until it reaches one that is in the same state as in an earlier call
+    # (frames only change, while they are the innermost one)
+    visited = []
+    sure = False # Whether the rule reference the next frame is waiting for matches for sure
+    oldest = None
+    for frame in reversed(frames):
+        key = (frame.rule_number, frame.step_number, frame.option_number, sure)
+        if frame.bound_key == key:
+            oldest = frame.bound
+            break
+        bound, sure = frame_bound(frame, sure)
+        visited.append((frame, key, bound))
+    for frame, key, bound in reversed(visited):
+        if bound is not None and (oldest is None or bound < oldest):
+            oldest = bound
+        frame.bound_key, frame.bound = key, oldest
+    return index if oldest is None or oldest > index else oldest
+def frame_bound(frame: Frame, sure):
+    # The oldest index the frame might still read (or None) and whether it matches for sure
+    if frame.rule_number >= len(frame.rules):
+        return None, False
+    rule = frame.rules[frame.rule_number]
+    if rule.operators is not None: # Pending operators are taken from the start on
+        return frame.start_index, False
+    bound = frame.start_index if rule.make_input_tokens_available and not frame.state_reference[0].events else None
+    step_number, option_number, history = frame.step_number, frame.option_number, frame.history
+    if step_number >= len(rule.steps):
+        return bound, True
+    certain_option = rule.certain_options[step_number]
+    if not sure and (certain_option is None or certain_option < option_number): # The step might not match
+        if option_number < len(rule.steps[step_number]) - 1: # The next option starts at the step again
+            bound = history[step_number].state_reference[0].current_index
+    elif not rule.fallible_after[step_number]:
+        return bound, True
+
+    # The rule might fail, then the next candidate rules continue behind the steps they share with it
+    for candidate in frame.rules[frame.rule_number + 1:]:
+        shared = 0
+        if candidate.operators is None:
+            while shared < len(candidate.steps) and shared < len(rule.steps) and len(rule.steps[shared]) == 1 and candidate.steps[shared][0].requirement is rule.steps[shared][0].requirement:
+                shared += 1
+        index = history[min(shared, step_number)].state_reference[0].current_index
+        if bound is None or index < bound:
+            bound = index
+        if candidate.operators is None and shared == len(candidate.steps) and shared <= step_number: # It matches for sure
+            return bound, True
+    return bound, False
+
+# Use this
+# The input may be a string, a file object or an iterable of string chunks
+# For untrusted inputs, "max_attempts" (of rules) and "timeout" (in seconds) bound the work of the parser. If one of
+# them is exceeded, "ParseLimitExceeded" is raised.
+# Generated parsers (see "tinyparser.codegen") only support packrat caches: with a budget, a profiler, events or
+# "iterative", the rules are interpreted instead.
+def parse(language: Language, input, cache: PackratCache=None, profiler=None, max_attempts=None, timeout=None):
+    budget = Budget(max_attempts, timeout) if max_attempts is not None or timeout is not None else None
+    if language.result_cache is not None:
+        return language.result_cache.parse(language, input, cache, profiler, budget)
+    tokens, cache, profiler = open_input(language, input, cache, profiler)
+    try:
+        return parse_tokens(language, tokens, cache, profiler, budget=budget)
+    finally:
+        close_input(cache)
+def parse_tokens(language: Language, tokens, cache: PackratCache=None, profiler=None, events=False, budget: Budget=None):
+    if language.codegen and not events and budget is None and profiler is None and not language.iterative:
+        return parse_generated(language, tokens, cache)
+    parser_state = [ParserState(tokens, 0, cache, profiler, events, budget)]
+    token_list = parser_state[0].token_list
+    engine = parse_iterative if language.iterative else parse_ex
+    token_list.frames = [] # Tokens are released, once the parser can't return to them anymore
+    try:
+        result, success = engine(language, language.root_rule, parser_state)
+        return None if not success or parser_state[0].current_token else result
+    finally:
+        token_list.frames = None
+        if profiler is not None:
+            profiler.abort() # Attempts, that a raised exception left in progress
+def open_input(language: Language, input, cache: PackratCache=None, profiler=None):
+    if cache is None and language.packrat:
+        cache = PackratCache(None if language.packrat is True else language.packrat)
+    if cache is not None:
+        cache.clear() # Memoized results are only valid for one token list
+    if language.scanner is None:
+        language.compile()
+    tokens = TokenStore(language.scanner, read_chunks(input))
+    tokens.profiler = profiler = profiler or language.profiler
+    if isinstance(input, str):
+        while tokens.fill(): # Tokenize up front, so tokenization errors surface before parsing
+            pass
+    return tokens, cache, profiler
+def close_input(cache: PackratCache=None):
+    if cache is not None:
+        cache.clear() # Don't keep the results (and thus the tokens) alive after parsing, only the counters
+
+# Event Parsing (SAX-style)
+# Instead of building results, "parse_events" reports the matched rules and their tokens to a handler. Transformers,
+# destinations and targets are not applied and no "input_tokens" are sliced. The events are delivered after the whole
+# input matched, so there are none for backtracked alternatives. Returns, whether the input matched.
+class EventHandler:
+    def enter(self, rule, target, start_token): # A rule (its key) with the target it would build, "start_token" is None, if the rule matched no tokens
+        pass
+    def token(self, token): # A token taken by the current rule
+        pass
+    def exit(self, rule, end_token): # The rule is complete, "end_token" is its last token
+        pass
+def parse_events(language: Language, input, handler: EventHandler, cache: PackratCache=None, profiler=None, max_attempts=None, timeout=None):
+    budget = Budget(max_attempts, timeout) if max_attempts is not None or timeout is not None else None
+    tokens, cache, profiler = open_input(language, input, cache, profiler)
+    try:
+        match = parse_tokens(language, tokens, cache, profiler, events=True, budget=budget)
+    finally:
+        close_input(cache)
+    if match is None:
+        return False
+    handler.enter(match.rule.key, match.rule.target, match.start_token)
+    stack = [(match, iter(match.children))]
+    while stack:
+        match, children = stack[-1]
+        for child in children:
+            if isinstance(child, RuleMatch):
+                handler.enter(child.rule.key, child.rule.target, child.start_token)
+                stack.append((child, iter(child.children)))
+                break
+            handler.token(child)
         else:
-            print("Abstract Syntax Tree")
-        for attribute, value in vars(value).items():
-            if attribute == "grammar_rule":
-                continue
-            print("    "*indent + "    ." + attribute + " = ", end="")
-            if attribute == "input_tokens" and value:
-                print("from (%d:%d) to (%d:%d)" % (
-                    value[0].position.line
-                    , value[0].position.column
-                    , value[-1].end.line
-                    , value[-1].end.column
-                ))
-            else:
-                print_ast(value, indent+1)
-    elif value == []:
-        print("[]")
-    elif isinstance(value, list):
-        print("[")
-        for number, value in enumerate(value, 1):
-            print("    "*indent + "    ." + str(number) + " = ", end="")
-            print_ast(value, indent+1)
-        print("    "*indent + "]")
-    elif isinstance(value, str):
-        print('"%s"' % value)
-    else:
-        print(value)
+            stack.pop()
+            handler.exit(match.rule.key, match.end_token)
+    return True
+
+# AST Visualizer (see "write_ast" for other formats and files)
+def print_ast(value, indent=None):
+    write_ast(value, None, "text", indent)
+
+# Batch Parsing
+from .batch import parse_many, iparse_many, parse_split
+
+# Incremental Parsing
+from .incremental import Document, parse_document, reparse
+
+# Profiling
+from .profiling import Profiler
+
+# Code Generation
+from .codegen import parse_generated
+
+# Asynchronous Parsing
+from .asynchronous import parse_async
+
+# Result Caching
+from .caching import ResultCache
+
+# Serialization
+from .serialization import write_ast, read_ast
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import asyncio
+from . import Language, PackratCache, parse
+
+# Reads the chunks (bytes or strings) of an asynchronous stream:
+# anything with a coroutine "read(size)" (like "asyncio.StreamReader") or an asynchronous iterable
+async def read_chunks_async(stream, chunk_size=65536):
+    if hasattr(stream, "read"): # Iterating a "StreamReader" would read lines, which might exceed its limit
+        while chunk := await stream.read(chunk_size):
+            yield chunk
+    else:
+        async for chunk in stream:
+            yield chunk
+
+# Parses an asynchronous stream and returns the same result as "parse".
+# The parser runs in a thread of its own, so the event loop stays responsive. Whenever the tokenizer needs more input,
+# the thread waits for the event loop to receive the next chunk, so parsing overlaps with the transfer of the input.
+# Once cancelled, it waits for the thread to stop, which raises when it waits for the next chunk.
+async def parse_async(language: Language, stream, cache: PackratCache=None, profiler=None, chunk_size=65536):
+    loop = asyncio.get_running_loop()
+    if language.compiled_rules is None or language.scanner is None:
+        language.compile() # Not in the thread, in case other tasks parse with the same language at the same time
+    chunks = read_chunks_async(stream, chunk_size)
+    lock = Lock()
+    stopped = False # Whether nobody is waiting for the result anymore
+    receiving = None # The future of the chunk the thread waits for
+    def receive():
+        nonlocal receiving
+        while True:
+            with lock:
+                if stopped:
+                    raise asyncio.CancelledError()
+                receiving = asyncio.run_coroutine_threadsafe(chunks.__anext__(), loop)
+            try:
+                yield receiving.result() # Raises, if it is cancelled
+            except StopAsyncIteration:
+                return
+    executor = ThreadPoolExecutor(1, thread_name_prefix="tinyparser")
+    parsing = executor.submit(parse, language, receive(), cache, profiler)
+    try:
+        return await asyncio.wrap_future(parsing)
+    finally:
+        if not parsing.done():
+            with lock:
+                stopped = True
+                if receiving is not None:
+                    receiving.cancel()
+            await asyncio.wait([asyncio.wrap_future(parsing)])
+        executor.shutdown(wait=parsing.done()) # Joins the thread
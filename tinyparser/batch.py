@@ -0,0 +1,166 @@
+from multiprocessing import Pool
+import copy
+from . import Language, Token, TokenStore, ParserState, PackratCache, input_cursor, read_chunks, parse, parse_tokens
+
+# Worker Process
+worker_language = None
+def initialize_worker(language: Language):
+    global worker_language
+    worker_language = language.compile() # Compile once per worker, not once per input
+def parse_item(item):
+    index, input = item
+    try:
+        return index, parse(worker_language, input)
+    except Exception as error: # Report errors per input, so one bad input doesn't fail the whole batch
+        return index, error
+
+# Parses many independent inputs in a pool of worker processes.
+# Yields "(index, result)" as soon as each result is available.
+# If parsing an input raised an exception, the exception is yielded as its result.
+def iparse_many(language: Language, inputs, workers=None, chunksize=1, ordered=False):
+    if workers == 0: # Parse in the current process
+        initialize_worker(language)
+        yield from map(parse_item, enumerate(inputs))
+        return
+    with Pool(workers, initialize_worker, (language,)) as pool:
+        distribute = pool.imap if ordered else pool.imap_unordered
+        yield from distribute(parse_item, enumerate(inputs), chunksize)
+
+# Parses many independent inputs in a pool of worker processes and returns the results in input order
+def parse_many(language: Language, inputs, workers=None, chunksize=1):
+    return [result for index, result in iparse_many(language, inputs, workers, chunksize, True)]
+
+# Split Parsing
+# Parses one huge input in a pool of worker processes by splitting a long repetition (like the elements of a JSON
+# array or the statements of a C++ file) into chunks of its elements. "rule_path" names the repetition: rules with the
+# target "[]" that match an element, optionally a separator token, and the repetition again (e.g. "1.1." of the JSON
+# language or "1." of the C++ language). The input is tokenized up front and split at separators (or - if the
+# repetition has none - behind "terminators") in the bracket group with the most of them.
+# The workers tokenize and parse their chunks from "rule_path" and the lists of elements are joined. Everything else
+# is parsed as usual, but with the joined lists taking the place of the repetition behind the first element.
+# Returns the same result as "parse": elements must not continue beyond a separator (or terminator) of their group.
+# If a chunk doesn't match on its own, the whole input is parsed sequentially instead.
+def parse_split(language: Language, input, rule_path: str, workers=None, chunk_tokens=10000
+    , brackets=[(Token.LEFT_PARENTHESIS, Token.RIGHT_PARENTHESIS), (Token.LEFT_SQUARE_BRACKET, Token.RIGHT_SQUARE_BRACKET), (Token.LEFT_CURLY_BRACKET, Token.RIGHT_CURLY_BRACKET)]
+    , terminators=[Token.SEMICOLON, Token.RIGHT_CURLY_BRACKET]
+):
+    separator = find_separator(language, rule_path)
+    text = input if isinstance(input, str) else "".join(read_chunks(input)) # The workers get parts of the text
+    tokens = TokenStore(language.scanner, [text])
+    while tokens.fill():
+        pass
+    split = find_split_points(tokens, separator, brackets, terminators)
+    if split is None:
+        return parse_tokens(language, tokens)
+    starts, end = split
+
+    # Chunks of at least "chunk_tokens" tokens, beginning with the second element
+    chunk_starts = starts[:1]
+    for start in starts[1:]:
+        if start - chunk_starts[-1] >= chunk_tokens:
+            chunk_starts.append(start)
+    if len(chunk_starts) < 2:
+        return parse_tokens(language, tokens)
+    chunk_ends = [start - (separator is not None) for start in chunk_starts[1:]] + [end]
+    chunks = [
+        ( # The text from behind the previous token (so whitespaces before the first token are kept) to the last token
+            text[tokens.ends[start - 1]:tokens.ends[max(start, chunk_end) - 1]]
+            , input_cursor(tokens.ends[start - 1] + 1, tokens.end_lines[start - 1], tokens.end_columns[start - 1])
+            , chunk_end - start
+        )
+        for start, chunk_end in zip(chunk_starts, chunk_ends)
+    ]
+
+    repetition = derive_language(language, rule_path)
+    if workers == 0: # Parse in the current process
+        initialize_worker(repetition)
+        outcomes = list(map(parse_chunk, chunks))
+    else:
+        with Pool(workers, initialize_worker, (repetition,)) as pool:
+            outcomes = pool.map(parse_chunk, chunks)
+    elements = []
+    for outcome in outcomes:
+        if outcome is None:
+            return parse_tokens(language, tokens)
+        elements.extend(outcome)
+
+    # The repetition behind the first element is taken from the cache. Chains are disabled, as they don't use it.
+    cache = PackratCache()
+    cache.put(rule_path, chunk_starts[0], elements, True, end)
+    return parse_tokens(derive_language(language, chains=False), tokens, cache)
+
+def parse_chunk(chunk):
+    text, start, count = chunk
+    tokens = TokenStore(worker_language.scanner, [text], start=start)
+    try:
+        result = parse_tokens(worker_language, tokens)
+    except Exception: # The chunk might have been split at a wrong place
+        return None
+    if not isinstance(result, list) or tokens.offset + len(tokens.type_ids) != count: # Tokenized differently on its own
+        return None
+    return result
+
+# A compiled copy of a language with another root rule and/or without chains (see "Chain")
+def derive_language(language: Language, root_rule=None, chains=True):
+    derived = copy.copy(language) # Without the compiled data
+    derived.root_rule = root_rule or language.root_rule
+    derived.result_cache = None
+    derived.compile()
+    if not chains:
+        for rule in derived.compiled_rules.values():
+            for options in rule.steps:
+                for option in options:
+                    option.tail = None
+    return derived
+
+# Returns the separator between the elements of the repetition "rule_path" (or None, if there is none)
+def find_separator(language: Language, rule_path: str):
+    if language.compiled_rules is None or language.scanner is None:
+        language.compile()
+    separators = set()
+    for rule in language.lookup(rule_path):
+        references = [option for options in rule.steps for option in options if option.requirement == rule_path]
+        if rule.chain is not list or references and (references != rule.steps[-1] or len(rule.steps) not in (2, 3)
+            or any(option.destinations != [(None, None)] for option in references)):
+            raise ValueError("Rule [%s] is no repetition of elements that can be split" % rule.key)
+        if references and len(rule.steps) == 3:
+            separators.update(option.requirement for option in rule.steps[1])
+        elif references:
+            separators.add(None)
+    if len(separators) != 1 or any(isinstance(separator, str) for separator in separators):
+        raise ValueError("The repetition [%s] has no unique separator token" % rule_path)
+    return separators.pop()
+
+# Returns the start indices of the elements behind separators (or terminators) in the bracket group with the most
+# of them, together with the end index of the group. Returns None, if there are none or the brackets don't match.
+def find_split_points(tokens: TokenStore, separator, brackets, terminators):
+    closing = dict(brackets) # Opening bracket -> its closing bracket
+    state = ParserState(tokens) # To match the separator
+    starts = {-1: []} # Index of the opening bracket of a group (-1 outside of all brackets) -> element start indices
+    ends = {-1: len(tokens.type_ids)} # Index of the opening bracket of a group -> index of its closing bracket
+    stack = [(-1, None)] # The open groups with their expected closing brackets
+    for index, type_id in enumerate(tokens.type_ids):
+        token_type = tokens.token_types[type_id]
+        if token_type in closing:
+            stack.append((index, closing[token_type]))
+            starts[index] = []
+        elif token_type == stack[-1][1]:
+            ends[stack.pop()[0]] = index
+            if separator is None and token_type in terminators:
+                starts[stack[-1][0]].append(index + 1)
+        elif token_type in closing.values():
+            return None
+        elif separator is None:
+            if token_type in terminators:
+                starts[stack[-1][0]].append(index + 1)
+        else:
+            state.current_index = index
+            if state.peek(separator) is not None:
+                starts[stack[-1][0]].append(index + 1)
+    if len(stack) > 1:
+        return None
+    group = max(starts, key=lambda group: len(starts[group]))
+    group_starts = [start for start in starts[group] if start < ends[group]]
+    if not group_starts:
+        return None
+    return group_starts, ends[group]
@@ -0,0 +1,178 @@
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from types import MappingProxyType
+from weakref import WeakKeyDictionary
+import hashlib, sys
+from . import Language, AST, InputToken, TokenSpan, PackratCache, Budget, input_cursor, read_chunks, open_input, close_input, parse_tokens
+from .codegen import Generator
+
+# Result Cache
+# Remembers the results of whole inputs across calls to "parse", keyed by a hash of the input and of the grammar.
+# Inputs that are parsed again (the same config fragments, regular expressions, payloads etc.) are neither tokenized
+# nor parsed again. The least recently used results are evicted, once "maxsize" results or (approximately) "maxbytes"
+# bytes of results are cached. Results are returned as...
+# - "copy": a deep copy for every caller (the default)
+# - "frozen": read-only for all callers: lists become tuples, dictionaries read-only mappings, and AST objects,
+#   tokens and cursors instances of read-only subclasses (with the same name). Other objects are shared as they are.
+# - "shared": the same object for all callers, which must then not modify it
+class ResultCache:
+    def __init__(self, maxsize=1024, maxbytes=None, mode="copy"):
+        if mode not in ("copy", "frozen", "shared"):
+            raise ValueError("Unknown result cache mode '%s'" % mode)
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.mode = mode
+        self.entries = OrderedDict() # (grammar key, input hash) -> (result, estimated bytes), least recently used first
+        self.grammars = WeakKeyDictionary() # Language -> (its compiled rules, grammar key, the objects the key refers to)
+        self.referents = {} # Grammar key -> [the objects it refers to, number of results cached with it]
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+    def __len__(self):
+        return len(self.entries)
+
+    # Only the limits are pickled (e.g. along with a language sent to "parse_many" workers), not the results
+    def __getstate__(self):
+        return {"maxsize": self.maxsize, "maxbytes": self.maxbytes, "mode": self.mode}
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def parse(self, language: Language, input, cache: PackratCache=None, profiler=None, budget: Budget=None):
+        if language.compiled_rules is None or language.scanner is None:
+            language.compile()
+        if not isinstance(input, str): # Streams are read completely, to hash them
+            input = "".join(read_chunks(input))
+        _, grammar_key, referents = self.grammar(language)
+        key = (grammar_key, hashlib.sha256(input.encode("utf-8", "surrogatepass")).digest())
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            return deepcopy(entry[0]) if self.mode == "copy" else entry[0]
+
+        tokens, cache, profiler = open_input(language, input, cache, profiler)
+        try:
+            result = parse_tokens(language, tokens, cache, profiler, budget=budget)
+        finally:
+            close_input(cache)
+        if self.mode == "frozen":
+            result = freeze(result, {})
+        self.put(key, deepcopy(result) if self.mode == "copy" else result, referents)
+        return result
+
+    # Identifies the grammar by the hash of its structure (see "codegen.Generator") and the identity of the objects
+    # it refers to (targets, token types, transformers etc.), so grammars compiled from the same rules share results.
+    # Returns (the compiled rules, the grammar key, the objects it refers to).
+    def grammar(self, language: Language):
+        entry = self.grammars.get(language, None)
+        if entry is None or entry[0] is not language.compiled_rules: # Not seen before or compiled again since
+            generator = Generator(language)
+            identity = (generator.fingerprint, [id(constant) for constant in generator.constants]
+                , language.strip_whitespaces, id(language.token_class))
+            entry = (language.compiled_rules, hashlib.sha256(repr(identity).encode("utf-8")).digest(), (*generator.constants, language.token_class))
+            with self.lock:
+                self.grammars[language] = entry
+        return entry
+
+    # Keeps the objects the grammar key refers to as long as results are cached with it (the language might be
+    # collected before), so their ids aren't reused by other objects meanwhile
+    def put(self, key, result, referents=()):
+        size = estimate_size(result)
+        with self.lock:
+            if key in self.entries:
+                return
+            if self.maxsize is not None and self.maxsize <= 0 or self.maxbytes is not None and size > self.maxbytes:
+                return
+            self.entries[key] = (result, size)
+            self.bytes += size
+            self.referents.setdefault(key[0], [referents, 0])[1] += 1
+            while (self.maxsize is not None and len(self.entries) > self.maxsize
+                or self.maxbytes is not None and self.bytes > self.maxbytes):
+                (grammar_key, _), (_, size) = self.entries.popitem(last=False)
+                self.bytes -= size
+                self.evictions += 1
+                held = self.referents[grammar_key]
+                held[1] -= 1
+                if not held[1]:
+                    del self.referents[grammar_key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.grammars.clear()
+            self.referents.clear()
+            self.bytes = 0
+
+# Approximates the memory held by a result: its lists, dictionaries, AST objects and tokens (shared objects once)
+def estimate_size(value):
+    size = 0
+    seen = set()
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, (dict, MappingProxyType)):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, AST):
+            stack.append(vars(value))
+        elif isinstance(value, TokenSpan): # The tokens of an expression are counted once for all its operations
+            stack.append(value.tokens)
+        elif isinstance(value, (InputToken, input_cursor)):
+            stack.extend(getattr(value, name, None) for name in slot_names(type(value)))
+    return size
+
+# Read-only Results
+def refuse_modification(self, *args):
+    raise AttributeError("'%s' object is a cached result and cannot be modified" % type(self).__name__)
+
+frozen_classes = {} # Class -> its read-only subclass
+def frozen_class(cls):
+    frozen = frozen_classes.get(cls, None)
+    if frozen is None:
+        frozen = frozen_classes[cls] = type(cls.__name__, (cls,), {
+            "__slots__": (), "__module__": cls.__module__, "__qualname__": cls.__qualname__
+            , "__setattr__": refuse_modification, "__delattr__": refuse_modification
+        })
+    return frozen
+
+def slot_names(cls):
+    return [name for klass in cls.__mro__ for name in getattr(klass, "__slots__", ())]
+
+# Returns a read-only copy of a result ("memo" maps the id() of every copied object to its copy)
+def freeze(value, memo):
+    frozen = memo.get(id(value), None)
+    if frozen is not None:
+        return frozen
+    if isinstance(value, (list, tuple)):
+        frozen = tuple(freeze(item, memo) for item in value)
+    elif isinstance(value, dict):
+        frozen = MappingProxyType({key: freeze(item, memo) for key, item in value.items()})
+    elif isinstance(value, AST):
+        frozen = object.__new__(frozen_class(type(value)))
+        memo[id(value)] = frozen # Before the attributes, in case they refer back to it
+        vars(frozen).update((key, freeze(item, memo)) for key, item in vars(value).items())
+        return frozen
+    elif isinstance(value, (TokenSpan, InputToken, input_cursor)): # Token spans keep sharing the (frozen) tokens of their expression
+        frozen = object.__new__(frozen_class(type(value)))
+        memo[id(value)] = frozen
+        for name in slot_names(type(value)):
+            if hasattr(value, name):
+                object.__setattr__(frozen, name, freeze(getattr(value, name), memo))
+        return frozen
+    else:
+        return value
+    memo[id(value)] = frozen
+    return frozen
@@ -0,0 +1,431 @@
+from . import Language, InputToken, TokenType, TokenBuffer, PackratCache, set_or_append, match_operators
+from inspect import isclass
+import hashlib, importlib.util, os, re
+
+# Code Generation
+# Turns the rules of a language into a Python module with one function per rule path.
+# The module only depends on the structure of the grammar: targets, token types, transformers etc. are passed to
+# its "bind" function as constants when it is loaded. This way, it can be cached on disk by a hash of the grammar.
+VERSION = 4 # Increase, whenever the generated code changes
+
+# A reference to an object that is passed to the generated module when it is loaded
+class Constant:
+    def __init__(self, number):
+        self.number = number
+    def __repr__(self):
+        return "c%d" % self.number
+
+class Generator:
+    group_size = 16 # How many rules starting with literals are checked at once
+    def __init__(self, language: Language):
+        if language.compiled_rules is None:
+            language.compile()
+        self.constants = []
+        self.constant_numbers = {} # id() of the object -> number of its constant
+        rules = list(language.compiled_rules.values())
+        rule_numbers = {rule.key: number for number, rule in enumerate(rules)}
+
+        # All rule paths that are referenced, in order of their first appearance
+        paths = [language.root_rule]
+        for rule in rules:
+            for options in rule.steps:
+                for option in options:
+                    if isinstance(option.requirement, str) and option.requirement not in paths:
+                        paths.append(option.requirement)
+        self.paths = [(path, [rule_numbers[rule.key] for rule in language.lookup(path)]) for path in paths]
+        self.path_numbers = {path: number for number, path in enumerate(paths)}
+
+        # Describe every rule with plain values and constants only (first the steps, then the FIRST sets)
+        self.rules = [self.describe_rule(rule) for rule in rules]
+        for description, rule in zip(self.rules, rules):
+            description["first"] = sorted(self.constant(token_type).number for token_type in rule.first)
+            description["first_literals"] = sorted((self.constant(token_type).number, tuple(sorted(values))) for token_type, values in rule.first_literals.items())
+            description["nullable"] = rule.nullable
+        self.fingerprint = hashlib.sha256(repr((VERSION, self.paths, self.rules)).encode("utf-8")).hexdigest()
+
+    def constant(self, value):
+        number = self.constant_numbers.get(id(value), None)
+        if number is None:
+            number = self.constant_numbers[id(value)] = len(self.constants)
+            self.constants.append(value)
+        return Constant(number)
+
+    def describe_rule(self, rule):
+        if rule.operators is not None: # Operator tables are matched by "match_operators"
+            return {"key": rule.key, "operators": self.constant(rule), "operand": self.path_numbers[rule.operand]}
+
+        # How to build the result (same order of checks as in "CompiledRule.build")
+        target = rule.target
+        if isinstance(target, dict):
+            target = ("build", self.constant(rule))
+        elif target == []:
+            target = ("list",)
+        elif target == "":
+            target = ("join",)
+        elif isinstance(target, str):
+            target = ("field", target)
+        elif isclass(target) and "__init__" in vars(target) or not isclass(target) and callable(target):
+            target = ("call", self.constant(target))
+        elif isclass(target):
+            target = ("object", self.constant(target))
+        elif target is not None:
+            target = ("value", self.constant(target))
+        else:
+            target = ("none",)
+        return {
+            "key": rule.key, "target": target
+            , "input_tokens": rule.make_input_tokens_available, "grammar_rule": rule.make_grammar_rule_available
+            , "chain": rule.chain.__name__ if rule.chain is not None else None
+            , "tails": [number for number, option in enumerate(rule.steps[-1] if rule.steps else []) if option.tail is not None]
+            , "steps": [
+                [(self.describe_requirement(rule, option.requirement), self.describe_destinations(option.destinations)) for option in options]
+                for options in rule.steps
+            ]
+        }
+    def describe_requirement(self, rule, requirement):
+        if isinstance(requirement, TokenType):
+            return ("type", self.constant(requirement))
+        elif isinstance(requirement, InputToken):
+            if isinstance(requirement.value, str):
+                return ("token", self.constant(requirement.type), requirement.value)
+            elif isinstance(requirement.value, re.Pattern):
+                return ("pattern", self.constant(requirement.type), self.constant(requirement.value))
+            return ("never",)
+        elif isinstance(requirement, str):
+            return ("rule", self.path_numbers[requirement])
+        return ("unknown", "Unknown requirement in rule [%s] of type: %s" % (rule.key, type(requirement)))
+    def describe_destinations(self, destinations):
+        descriptions = []
+        for destination, transformer in destinations:
+            if isinstance(transformer, str):
+                transformer = ("attribute", transformer)
+            elif callable(transformer):
+                transformer = ("call", self.constant(transformer))
+            else:
+                transformer = None
+
+            # Same order of checks as in "finish_rule"
+            if destination == None:
+                destination = ("append",)
+            elif destination == "":
+                destination = ("merge",)
+            elif isinstance(destination, int):
+                destination = ("index", destination)
+            elif destination != False:
+                destination = ("key", destination if isinstance(destination, str) else self.constant(destination))
+            else:
+                destination = ("drop",)
+            descriptions.append((transformer, destination))
+        return descriptions
+
+    # Generate the source code of the module
+    def source(self):
+        lines = []
+        shift = [0] # Extra indentation of the rules grouped under a common check
+        def emit(indent, line):
+            lines.append("    " * (indent + shift[0]) + line if line else "")
+        requirement_numbers = {} # Requirement description -> number, equal requirements can reuse each others results
+        first_sets = {} # Tuple of constant numbers -> name of the frozenset
+        literal_sets = {} # Tuple of (constant number, literal values) -> names of the frozensets of token types and (token type, value)
+
+        emit(0, "# Generated by tinyparser.codegen from a grammar with fingerprint %s - do not edit" % self.fingerprint)
+        emit(0, "def bind(constants, set_or_append, match_operators):")
+        if self.constants:
+            emit(1, "%s, = constants" % ", ".join("c%d" % number for number in range(len(self.constants))))
+        for rule in self.rules:
+            first = tuple(rule["first"])
+            if not rule["nullable"] and first and first not in first_sets:
+                first_sets[first] = "first_%d" % len(first_sets)
+                emit(1, "%s = frozenset((%s,))" % (first_sets[first], ", ".join("id(c%d)" % number for number in first)))
+            literals = tuple(rule["first_literals"])
+            if not rule["nullable"] and literals and literals not in literal_sets:
+                literal_sets[literals] = ("restricted_%d" % len(literal_sets), "literals_%d" % len(literal_sets))
+                emit(1, "%s = frozenset((%s,))" % (literal_sets[literals][0], ", ".join("id(c%d)" % number for number, values in literals)))
+                emit(1, "%s = frozenset((%s,))" % (literal_sets[literals][1], ", ".join(
+                    "(id(c%d), %r)" % (number, value) for number, values in literals for value in values
+                )))
+        if literal_sets:
+            emit(1, "restricted = %s" % " | ".join(names[0] for names in literal_sets.values()))
+
+        # Consecutive rules, that only start with literals (like keywords), are checked in groups: Otherwise, grammars
+        # with hundreds of keywords would check them one by one for every token
+        groups = {} # (path number, position of its first rule) -> (name of the frozenset of (token type, value), rule count)
+        for path_number, (path, rule_numbers) in enumerate(self.paths):
+            runs = [[]] # Positions of consecutive rules in the path, that only start with literals
+            for position, rule_number in enumerate(rule_numbers):
+                rule = self.rules[rule_number]
+                if rule["nullable"] or not rule["first_literals"] or len(rule["first_literals"]) != len(rule["first"]):
+                    runs.append([])
+                    continue
+                if len(runs[-1]) == self.group_size:
+                    runs.append([])
+                runs[-1].append(position)
+            for run in runs:
+                if len(run) > 1:
+                    name = groups[(path_number, run[0])] = ("group_%d" % len(groups), len(run))
+                    emit(1, "%s = frozenset((%s,))" % (name[0], ", ".join(sorted({
+                        "(id(c%d), %r)" % (number, value)
+                        for grouped in run for number, values in self.rules[rule_numbers[grouped]]["first_literals"] for value in values
+                    }))))
+
+        # Chained rules add their steps to the result of the rule referencing them (see "tinyparser.Chain")
+        chained_rules = [(number, rule) for number, rule in enumerate(self.rules) if rule.get("chain", None)]
+        if chained_rules:
+            emit(1, "class Chain:")
+            emit(2, "__slots__ = ('add', 'history', 'options')")
+            emit(2, "def __init__(self, add, history, options):")
+            emit(3, "self.add, self.history, self.options = add, history, options")
+        for rule_number, rule in chained_rules:
+            emit(1, "def add_%d(result, owned, history, options): # Rule %r" % (rule_number, rule["key"]))
+            varying = self.varying_steps(rule)
+            if varying:
+                emit(2, "%s, = options" % ", ".join("option_%d" % step_number for step_number in varying))
+            self.emit_result(emit, 2, rule)
+            emit(2, "return None")
+        emit(1, "def parser(tokens, cache):")
+        emit(2, "type_at, value_at, get, token_slice = tokens.type_at, tokens.value_at, tokens.get, tokens.slice")
+        emit(2, "literal_at, has_literal = tokens.literal_at, tokens.has_literal")
+
+        # One function per rule path, trying its rules in order
+        for path_number, (path, rule_numbers) in enumerate(self.paths):
+            emit(2, "")
+            emit(2, "def match_%d(index, tail=None): # %r" % (path_number, path))
+            emit(3, "kind = id(type_at(index)) # Token types are compared by identity, which is faster than hashing them")
+            if any(not self.rules[rule_number]["nullable"] and self.rules[rule_number]["first_literals"] for rule_number in rule_numbers):
+                emit(3, "literal = literal_at(index) if kind in restricted else None # Rules only starting with literals check it")
+            emit(3, "history = [(None, None, index)] # (requirement, result, end index) per step, reused by the next rules")
+            grouped = 0 # Rules left in the current group
+            for position, rule_number in enumerate(rule_numbers):
+                rule = self.rules[rule_number]
+                group = groups.get((path_number, position), None)
+                if group is not None:
+                    shift[0], grouped = 0, group[1]
+                    emit(3, "if (kind, literal) in %s: # The next %d rules only start with these literals" % group)
+                shift[0], grouped = (1, grouped - 1) if grouped else (0, 0)
+                if rule["nullable"]:
+                    emit(3, "while True: # Rule %r" % rule["key"])
+                elif rule["first_literals"]:
+                    restricted, literals = literal_sets[tuple(rule["first_literals"])]
+                    emit(3, "while kind in %s and (kind not in %s or (kind, literal) in %s): # Rule %r" % (
+                        first_sets[tuple(rule["first"])], restricted, literals, rule["key"]
+                    ))
+                elif rule["first"]:
+                    emit(3, "while kind in %s: # Rule %r" % (first_sets[tuple(rule["first"])], rule["key"]))
+                else:
+                    continue # The rule can't match anything
+                if "operators" in rule:
+                    emit(4, "matcher = match_operators(%r, %r, tokens, index)" % (rule["operators"], path))
+                    emit(4, "outcome = None")
+                    emit(4, "try:")
+                    emit(5, "while True:")
+                    emit(6, "outcome = rule_%d(matcher.send(outcome)[1])" % rule["operand"])
+                    emit(4, "except StopIteration as stop:")
+                    emit(5, "outcome = stop.value")
+                    emit(4, "if outcome is None:")
+                    emit(5, "break")
+                    emit(4, "return outcome")
+                    continue
+
+                # Match all steps
+                for step_number, options in enumerate(rule["steps"], 1):
+                    single = len(options) == 1
+                    if not single:
+                        emit(4, "option = -1")
+                    for option_number, (requirement, destinations) in enumerate(options):
+                        indent = 4
+                        if option_number:
+                            emit(4, "if option < 0:")
+                            indent = 5
+                        number = requirement_numbers.setdefault(requirement, len(requirement_numbers))
+                        if single:
+                            emit(indent, "if len(history) <= %d or history[%d][0] != %d:" % (step_number, step_number, number))
+                        else:
+                            emit(indent, "if len(history) > %d and history[%d][0] == %d:" % (step_number, step_number, number))
+                            emit(indent + 1, "option = %d" % option_number)
+                            emit(indent, "else:")
+                        tail = rule["chain"] if step_number == len(rule["steps"]) and option_number in rule["tails"] else None
+                        self.emit_attempt(emit, indent + 1, requirement, number, step_number, None if single else "option = %d" % option_number, tail)
+                    if not single:
+                        emit(4, "if option < 0:")
+                        emit(5, "break")
+                        if step_number in self.varying_steps(rule):
+                            emit(4, "option_%d = option" % step_number)
+
+                # The whole rule matched!
+                emit(4, "end = history[%d][2]" % len(rule["steps"]))
+                if rule["chain"]:
+                    options = "".join("option_%d, " % step_number for step_number in self.varying_steps(rule))
+                    emit(4, "if tail == %r:" % rule["chain"])
+                    emit(5, "return Chain(add_%d, history, (%s)), end" % (rule_number, options))
+                emit(4, "result = {None: []}")
+                emit(4, "owned = {None} # Keys of the lists that belong to this result (see \"set_or_append\")")
+                if rule["chain"]:
+                    emit(4, "chain = add_%d(result, owned, history, (%s))" % (rule_number, options))
+                    emit(4, "while chain is not None:")
+                    emit(5, "chain = chain.add(result, owned, chain.history, chain.options)")
+                else:
+                    self.emit_result(emit, 4, rule)
+                if rule["input_tokens"]:
+                    emit(4, "result['input_tokens'] = token_slice(index, end)")
+                if rule["grammar_rule"]:
+                    emit(4, "result['grammar_rule'] = (%r, %r)" % (path, rule["key"]))
+                target = rule["target"]
+                if target[0] == "build":
+                    emit(4, "return %r.build(result), end" % target[1])
+                elif target[0] == "list":
+                    emit(4, "return result[None], end")
+                elif target[0] == "join":
+                    emit(4, "return ''.join([str(value) for value in result[None]]), end")
+                elif target[0] == "field":
+                    emit(4, "return result.get(%r, None), end" % target[1])
+                elif target[0] == "call":
+                    emit(4, "return %r(*result[None], **{key: value for key, value in result.items() if key is not None}), end" % target[1])
+                elif target[0] == "object":
+                    emit(4, "object_result = %r()" % target[1])
+                    emit(4, "for key, value in result.items():")
+                    emit(5, "if key:")
+                    emit(6, "setattr(object_result, key, value)")
+                    emit(4, "return object_result, end")
+                elif target[0] == "value":
+                    emit(4, "return %r, end" % target[1])
+                else:
+                    emit(4, "values = result[None]")
+                    emit(4, "return (values[0] if len(values) == 1 else values or None), end")
+            shift[0] = 0
+            emit(3, "return None")
+
+        # Memoize the outcome of every rule reference (packrat parsing)
+        emit(2, "")
+        emit(2, "def memoized(rule_path, match):")
+        emit(3, "def rule(index):")
+        emit(4, "entry = cache.get(rule_path, index)")
+        emit(4, "if entry is not None:")
+        emit(5, "return (entry[0], entry[2]) if entry[1] else None")
+        emit(4, "outcome = match(index)")
+        emit(4, "if outcome is None:")
+        emit(5, "cache.put(rule_path, index, None, False, index)")
+        emit(4, "else:")
+        emit(5, "cache.put(rule_path, index, outcome[0], True, outcome[1])")
+        emit(4, "return outcome")
+        emit(3, "return rule")
+        emit(2, "if cache is None:")
+        for path_number, (path, rule_numbers) in enumerate(self.paths):
+            emit(3, "rule_%d = match_%d" % (path_number, path_number))
+        emit(2, "else:")
+        for path_number, (path, rule_numbers) in enumerate(self.paths):
+            emit(3, "rule_%d = memoized(%r, match_%d)" % (path_number, path, path_number))
+        emit(2, "return rule_0")
+        emit(1, "return parser")
+        return "\n".join(lines) + "\n"
+
+    # The steps, whose options have different destinations (the matched option is kept in "option_<step number>")
+    def varying_steps(self, rule):
+        return [
+            step_number for step_number, options in enumerate(rule["steps"], 1)
+            if len({repr(destinations) for requirement, destinations in options}) > 1
+        ]
+
+    # Send the results of all steps to their destinations in "result"
+    # For chained rules, the result of their last step may be a chain, which is returned instead.
+    def emit_result(self, emit, indent, rule):
+        for step_number, options in enumerate(rule["steps"], 1):
+            chain = bool(rule["chain"]) and step_number == len(rule["steps"])
+            if len({repr(destinations) for requirement, destinations in options}) == 1:
+                self.emit_destinations(emit, indent, rule, step_number, options[0][1], chain)
+                continue
+            for option_number, (requirement, destinations) in enumerate(options):
+                emit(indent, "%s option_%d == %d:" % ("elif" if option_number else "if", step_number, option_number))
+                if not self.emit_destinations(emit, indent + 1, rule, step_number, destinations, chain and option_number in rule["tails"]):
+                    emit(indent + 1, "pass")
+
+    # Try to match a requirement after the previous step and append it to the history
+    # Tail references of chained rules bypass the packrat cache, since chains are no results on their own.
+    def emit_attempt(self, emit, indent, requirement, number, step_number, on_success, tail=None):
+        emit(indent, "del history[%d:]" % step_number)
+        emit(indent, "position = history[%d][2]" % (step_number - 1))
+        kind = requirement[0]
+        if kind == "type":
+            condition, entry = "type_at(position) == %r" % requirement[1], "(%d, get(position), position + 1)" % number
+        elif kind == "token":
+            condition, entry = "type_at(position) == %r and has_literal(position, %r)" % requirement[1:], "(%d, get(position), position + 1)" % number
+        elif kind == "pattern":
+            condition, entry = "type_at(position) == %r and %r.match(value_at(position))" % requirement[1:], "(%d, get(position), position + 1)" % number
+        elif kind == "rule":
+            if tail is None:
+                emit(indent, "outcome = rule_%d(position)" % requirement[1])
+            else:
+                emit(indent, "outcome = match_%d(position, %r)" % (requirement[1], tail))
+            condition, entry = "outcome is not None", "(%d,) + outcome" % number
+        elif kind == "never":
+            condition, entry = "False", None
+        else:
+            emit(indent, "raise Exception(%r)" % requirement[1])
+            return
+        if on_success is None: # The only option of the step
+            emit(indent, "if not (%s):" % condition)
+            emit(indent + 1, "break")
+            if entry:
+                emit(indent, "history.append(%s)" % entry)
+        elif entry:
+            emit(indent, "if %s:" % condition)
+            emit(indent + 1, "history.append(%s)" % entry)
+            emit(indent + 1, on_success)
+
+    # Send the result of a step to its destinations (see "finish_rule")
+    def emit_destinations(self, emit, indent, rule, step_number, destinations, chain=False):
+        if not destinations:
+            return False
+        emit(indent, "value = history[%d][1]" % step_number)
+        if chain:
+            emit(indent, "if type(value) is Chain:")
+            emit(indent + 1, "return value")
+        for transformer, destination in destinations:
+            if transformer is not None and transformer[0] == "attribute":
+                emit(indent, "value = value.get(%r, None) if isinstance(value, dict) else getattr(value, %r, value)" % (transformer[1], transformer[1]))
+            elif transformer is not None:
+                emit(indent, "value = %r(value)" % transformer[1])
+            kind = destination[0]
+            if kind == "append":
+                emit(indent, "set_or_append(result, None, value, owned)")
+            elif kind == "merge":
+                emit(indent, "if not isinstance(value, dict):")
+                emit(indent + 1, "raise Exception(%r)" % ("Cannot insert non-dictionary into current object at rule [%s]" % rule["key"]))
+                emit(indent, "for key, item in value.items():")
+                emit(indent + 1, "set_or_append(result, key, item, owned)")
+            elif kind == "index":
+                emit(indent, "set_or_append(result, result[None][%r], value, owned)" % destination[1])
+            elif kind == "key":
+                emit(indent, "set_or_append(result, %r, value, owned)" % destination[1])
+        return True
+
+# The directory generated modules are cached in ("TINYPARSER_CACHE" or "~/.cache/tinyparser")
+def default_directory():
+    return os.environ.get("TINYPARSER_CACHE", None) or os.path.join(os.path.expanduser("~"), ".cache", "tinyparser")
+
+# Returns the parser generated for a language: a function(token buffer, packrat cache) returning the root rule function.
+# The generated module is written to "directory" once and imported from there afterwards.
+def load(language: Language, directory=None):
+    generator = Generator(language)
+    directory = directory or default_directory()
+    name = "tinyparser_%s" % generator.fingerprint[:32]
+    path = os.path.join(directory, name + ".py")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = "%s.%d.tmp" % (path, os.getpid()) # Other processes might be loading the same grammar
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(generator.source())
+        os.replace(temporary_path, path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.bind(generator.constants, set_or_append, match_operators)
+
+# Same as "parse_tokens", but with the generated parser of the language
+def parse_generated(language: Language, tokens, cache: PackratCache=None):
+    if language.generated_parser is None:
+        language.generated_parser = load(language, None if language.codegen is True else language.codegen)
+    tokens = tokens if isinstance(tokens, TokenBuffer) else TokenBuffer(tokens) # Keeps all tokens (see "TokenBuffer.frames")
+    outcome = language.generated_parser(tokens, cache)(0)
+    if outcome is None or tokens.get(outcome[1]) is not None:
+        return None
+    return outcome[0]
@@ -0,0 +1,439 @@
+from bisect import bisect_left, bisect_right
+import math
+from . import Language, PackratCache, TokenBuffer, TokenStore, ParserState, Chain, input_cursor, read_chunks, parse_tokens, parse_ex, parse_iterative
+
+# Token Buffer that remembers the furthest token index the parser looked at
+class TrackingBuffer(TokenBuffer):
+    def __init__(self, tokens):
+        super().__init__(tokens)
+        self.furthest = -1
+    def get(self, index):
+        if index > self.furthest:
+            self.furthest = index
+        return super().get(index)
+    def type_at(self, index):
+        if index > self.furthest:
+            self.furthest = index
+        return super().type_at(index)
+    def value_at(self, index):
+        if index > self.furthest:
+            self.furthest = index
+        return super().value_at(index)
+
+# Packrat Cache that also records, which tokens the outcome of each rule reference depends on
+# Entries are stored per token index, with the end and the furthest examined token relative to that index.
+# This way, the entries behind an edit can be shifted by splicing a list. The entries in front of an edit are only
+# checked against it (see "validity"), once they are looked up again.
+# Only the latest edits are kept (see "splice"). Entries made before them are checked against the number of the last
+# edit, that started at each token they examined, instead.
+# Chains are memoized as well, so the levels of a right recursive list behind an edit are not parsed again. The levels
+# only remember, where their own steps end (see "put"), as they all end with the last level: at their shared anchor.
+# An edit behind the own steps of a level thus only moves the anchor and links the levels around it again (see "settle").
+class IncrementalCache(PackratCache):
+    chains = True
+    def __init__(self, buffer: TrackingBuffer, language: Language=None, profiler=None):
+        super().__init__()
+        self.buffer = buffer
+        self.language = language # Parses the levels of chains again (see "reparse_level")
+        self.profiler = profiler
+        self.positions = [] # Token index -> {rule_path: entry (see "put")}
+        self.edits = [] # (start, end, count): the tokens "start" to "end" were replaced by "count" tokens (see "splice")
+        self.base = 0 # The number of edits before "edits"
+        self.version = 0 # The number of all edits
+        self.stamps = [] # Token index -> number of the last edit that started there (or -1)
+        self.pending = [] # Per rule reference being parsed: [the furthest examined token before it, its tail reference (see "get")]
+    def __len__(self):
+        return sum(len(entries) for entries in self.positions if entries)
+    def get(self, rule_path, index):
+        furthest = self.buffer.furthest
+        outcome = self.lookup(rule_path, index) # Might parse levels of a chain again, which moves the furthest token
+        tail = None
+        if type(rule_path) is tuple and self.pending: # A tail reference: the own steps of the rule being parsed end here
+            tail = self.pending[-1][1] = [furthest, index, None]
+        if outcome is None:
+            self.misses += 1
+            self.pending.append([furthest, None])
+            self.buffer.furthest = index - 1
+            return None
+        self.hits += 1
+        if tail is not None:
+            tail[2] = outcome
+        self.buffer.furthest = max(furthest, outcome[3])
+        return outcome[0], outcome[1], outcome[2]
+    def put(self, rule_path, index, result, success, end_index):
+        furthest = self.buffer.furthest
+        saved, tail = self.pending.pop()
+        self.buffer.furthest = max(saved, furthest)
+        if isinstance(result, Chain) and tail is not None and tail[2] is not None and tail[2][1] and result.history[-1].result is tail[2][0]:
+            outcome = self.link(rule_path, index, result, tail[1] - index, tail[0] - index, tail[2])
+        else:
+            # (result, success, end, furthest examined token, number of edits it is up to date with, token index it was
+            # made at, anchor of a level of a chain or None (see "link"))
+            self.store(rule_path, index, (result, success, end_index - index, furthest - index, self.version, index, None))
+            outcome = result, success, end_index, furthest, None
+        if type(rule_path) is tuple and self.pending: # The outcome of the tail reference of the rule being parsed
+            parent_tail = self.pending[-1][1]
+            if parent_tail is not None and parent_tail[1] == index:
+                parent_tail[2] = outcome
+    def store(self, rule_path, index, entry):
+        if index >= len(self.positions):
+            self.positions.extend([None] * (index + 1 - len(self.positions)))
+        if self.positions[index] is None:
+            self.positions[index] = {}
+        self.positions[index][rule_path] = entry
+    def entry(self, rule_path, index):
+        entries = self.positions[index] if index < len(self.positions) else None
+        return entries.get(rule_path, None) if entries else None
+    def clear(self):
+        self.positions.clear()
+        self.edits.clear()
+        self.base = self.version
+        self.stamps.clear()
+        self.pending.clear()
+
+    # Stores a level of a chain, whose own steps end at "own_end" and examine the tokens up to "own_furthest" (relative
+    # to "index"), and whose last step is linked to "outcome". The level ends with the anchor of that outcome, unless it
+    # is the last level. Returns the outcome of the level.
+    def link(self, rule_path, index, chain, own_end, own_furthest, outcome):
+        result, success, end, furthest, anchor = outcome
+        if anchor is None:
+            anchor = Anchor(end, furthest, self.version, index, furthest - index - own_end)
+        anchor.start = min(anchor.start, index)
+        anchor.furthest = max(anchor.furthest, index + own_furthest)
+        anchor.span = max(anchor.span, own_furthest)
+        self.store(rule_path, index, (chain, True, own_end, own_furthest, self.version, index, anchor))
+        return chain, True, end, max(furthest, index + own_furthest), anchor
+
+    # The outcome (result, success, end index, furthest examined token index, anchor) of a rule reference, if it is still valid
+    def lookup(self, rule_path, index):
+        entry = self.entry(rule_path, index)
+        if entry is None:
+            return None
+        if not self.validity(entry, index):
+            del self.positions[index][rule_path]
+            return None
+        if entry[6] is None:
+            return self.renew(rule_path, index, entry, None)
+        anchor = self.settle(entry[6], index)
+        if anchor is None:
+            return self.resolve(rule_path, index)
+        return self.renew(rule_path, index, self.entry(rule_path, index), anchor) # Settling might have linked it again
+    def renew(self, rule_path, index, entry, anchor):
+        if entry[4] != self.version or entry[6] is not anchor:
+            entry = self.positions[index][rule_path] = (*entry[:4], self.version, index, anchor)
+        if anchor is None:
+            return entry[0], entry[1], index + entry[2], index + entry[3], None
+        return entry[0], True, anchor.end, max(anchor.furthest, index + entry[3]), anchor
+
+    # Replaces the entries of the tokens "start" to "end" with "count" empty ones. Once there are more edits than
+    # tokens, the older half of them is dropped (entries and anchors, that weren't looked up since, do without them).
+    def splice(self, start, end, count):
+        self.positions[start:end] = [None] * count
+        stamps = self.stamps
+        if len(stamps) <= end:
+            stamps.extend([-1] * (end + 1 - len(stamps)))
+        stamps[start:end] = [self.version] * count
+        if not count: # The edit starts at the token behind it
+            stamps[start] = self.version
+        self.edits.append((start, end, count))
+        self.version += 1
+        if len(self.edits) > len(self.positions):
+            dropped = len(self.edits) // 2
+            del self.edits[:dropped]
+            self.base += dropped
+
+    # Checks an entry at "index" against the edits made since it was up to date: whether it doesn't depend on them (only
+    # its own steps for a level of a chain, the others are checked by its anchor)
+    def validity(self, entry, index):
+        if entry[4] < self.base: # Whether no later edit started at a token it examined
+            return max(self.stamps[index + 1:index + entry[3] + 1], default=-1) < entry[4]
+        index, furthest = entry[5], entry[3]
+        for start, end, count in self.edits[entry[4] - self.base:]:
+            if index >= start: # Behind the edit (the entries within it were removed)
+                index += count - (end - start)
+            elif index + furthest >= start:
+                return False
+        return True
+
+    # The anchor, that the level of a chain at "index" ends with, or None, if the level must be linked again (see "resolve")
+    def settle(self, anchor, index):
+        followed = []
+        while True:
+            if anchor.version != self.version:
+                self.catch_up(anchor)
+            for cut, front in anchor.fronts:
+                if index < cut:
+                    break
+            else:
+                return anchor
+            followed.append(anchor)
+            if front is None or front in followed: # The levels of an anchor might end with a level in front of them in turn
+                return None
+            anchor = front
+
+    # Moves an anchor behind the edits made since it was up to date. Afterwards, the levels around each edit behind the
+    # first of its levels are linked again (see "relink"). If some of these edits were dropped already, all of its
+    # levels are linked again instead, once they are looked up.
+    def catch_up(self, anchor):
+        if anchor.version < self.base:
+            anchor.fronts = [(math.inf, None)]
+            anchor.version = self.version
+            return
+        edited = [] # The token indices of these edits
+        for start, end, count in self.edits[anchor.version - self.base:]:
+            delta = count - (end - start)
+            edited = [position + delta if position >= end else min(position, start) for position in edited]
+            if start > anchor.furthest:
+                continue
+            if start >= anchor.first():
+                edited.append(start)
+            anchor.end, anchor.furthest = (position + delta if position >= end else position if position <= start else start + count for position in (anchor.end, anchor.furthest))
+            anchor.start = anchor.start + delta if anchor.start >= end else min(anchor.start, start)
+            anchor.fronts = [(cut + delta if cut >= end else min(cut, start), front) for cut, front in anchor.fronts]
+        anchor.version = self.version
+        for position in sorted(set(edited)):
+            self.relink(anchor, position)
+
+    # Links the levels of an anchor in front of an edit at "position" to the levels behind it again. These are the levels,
+    # whose own steps are still valid, but whose next level isn't. As each level they are linked to examines the edit,
+    # they are at most two spans in front of it. Should they end with another anchor afterwards, all its levels in front
+    # of the edit end with that one (or are linked again, once they are looked up, if there is no single one).
+    def relink(self, anchor, position):
+        levels = []
+        for index in range(max(anchor.first(), position - 2 * anchor.span - 2), min(position, len(self.positions))):
+            for rule_path, entry in list((self.positions[index] or {}).items()):
+                if entry[6] is None or not self.validity(entry, index) or self.settle(entry[6], index) is not anchor:
+                    continue
+                following = self.entry((entry[0].history[-1].requirement, rule_path[1]), index + entry[2])
+                if following is None or not self.validity(following, index + entry[2]) or following[6] is not None and self.settle(following[6], index + entry[2]) is not anchor:
+                    levels.append((rule_path, index))
+        if not levels:
+            return
+        anchor.fronts.append((position, None)) # Until they are linked
+        ends = {self.resolve(rule_path, index, position)[4] for rule_path, index in levels}
+        if ends == {anchor}:
+            anchor.fronts.pop()
+        elif len(ends) == 1 and None not in ends:
+            front = ends.pop()
+            anchor.fronts[-1] = (position, front)
+            front.start = min(front.start, anchor.start)
+            front.furthest = max(front.furthest, anchor.furthest)
+            front.span = max(front.span, anchor.span)
+
+    # Follows the levels of a chain, whose own steps are still valid, up to the first level that is valid as a whole
+    # or must be parsed again. Then the levels in front of it are linked to the outcome of their next level again
+    # (or parsed again, if it doesn't match anymore). The levels in front of "before" are never valid as a whole.
+    def resolve(self, rule_path, index, before=None):
+        levels = []
+        while True:
+            entry = self.entry(rule_path, index)
+            if entry is None or not self.validity(entry, index):
+                outcome = self.reparse_level(rule_path, index)
+                break
+            if entry[6] is None:
+                outcome = self.renew(rule_path, index, entry, None)
+                break
+            anchor = self.settle(entry[6], index) if before is None or index >= before else None
+            if anchor is not None:
+                outcome = self.renew(rule_path, index, self.entry(rule_path, index), anchor)
+                break
+            levels.append((rule_path, index, entry))
+            rule_path, index = (entry[0].history[-1].requirement, rule_path[1]), index + entry[2]
+        for rule_path, index, entry in reversed(levels):
+            if not outcome[1]:
+                outcome = self.reparse_level(rule_path, index)
+                continue
+            chain = entry[0]
+            chain.history[-1].result = outcome[0]
+            outcome = self.link(rule_path, index, chain, entry[2], entry[3], outcome)
+        return outcome
+    def reparse_level(self, rule_path, index):
+        entries = self.positions[index] if index < len(self.positions) else None
+        if entries:
+            entries.pop(rule_path, None)
+        engine = parse_iterative if self.language.iterative else parse_ex
+        engine(self.language, rule_path[0], [ParserState(self.buffer, index, self, self.profiler)], rule_path[1])
+        entry = self.positions[index][rule_path]
+        return self.renew(rule_path, index, entry, entry[6])
+
+# The end of the levels of a chain (see "IncrementalCache.link"). Its token indices are up to date with "version" edits.
+class Anchor:
+    __slots__ = ("end", "furthest", "version", "start", "span", "fronts")
+    def __init__(self, end, furthest, version, start, span):
+        self.end = end
+        self.furthest = furthest # The furthest token examined by any level
+        self.version = version
+        self.start = start # The index of the first level
+        self.span = span # The most tokens the own steps of a level examine
+        self.fronts = [] # (cut, anchor): the levels in front of the cut (and behind the previous one) end with that anchor instead (or must be linked again, if it is None)
+    def first(self): # The index, from which on the levels end with this anchor
+        return max(self.start, self.fronts[-1][0]) if self.fronts else self.start
+
+# Cursor of a token in a document. The edits in front of it (see "Document.shifts") only move it, once it is used.
+# Its distance to the cursor in front of it never changes, since an edit in between replaces its token (see "rebase").
+class document_cursor(input_cursor):
+    __slots__ = ("shifts", "version", "distance")
+    def __init__(self, cursor: input_cursor, shifts, previous: input_cursor):
+        self.shifts = shifts
+        self.version = len(shifts)
+        line_delta = cursor.line - previous.line
+        self.distance = cursor.index - previous.index, line_delta, cursor.column if line_delta else cursor.column - previous.column
+        slot_index.__set__(self, cursor.index)
+        slot_line.__set__(self, cursor.line)
+        slot_column.__set__(self, cursor.column)
+    def update(self):
+        index, line, column = slot_index.__get__(self), slot_line.__get__(self), slot_column.__get__(self)
+        for threshold, delta, sync_line, line_delta, column_delta in self.shifts[self.version:]:
+            if index >= threshold:
+                if line == sync_line:
+                    column += column_delta
+                line += line_delta
+                index += delta
+        slot_index.__set__(self, index)
+        slot_line.__set__(self, line)
+        slot_column.__set__(self, column)
+        self.version = len(self.shifts)
+slot_index, slot_line, slot_column = input_cursor.index, input_cursor.line, input_cursor.column
+def shifted(slot):
+    def get(cursor):
+        if cursor.version != len(cursor.shifts):
+            cursor.update()
+        return slot.__get__(cursor)
+    def set(cursor, value):
+        if cursor.version != len(cursor.shifts):
+            cursor.update()
+        slot.__set__(cursor, value)
+    return property(get, set)
+document_cursor.index, document_cursor.line, document_cursor.column = shifted(slot_index), shifted(slot_line), shifted(slot_column)
+def track_cursors(tokens, shifts, previous: input_cursor):
+    for token in tokens:
+        previous = token.position = document_cursor(token.position, shifts, previous)
+        previous = token.end = document_cursor(token.end, shifts, previous)
+
+# Moves all cursors of the tokens of a document behind all edits at once, by adding up their distances. Returns the new
+# shifts for them, the old ones only move the cursors of replaced tokens anymore.
+def rebase(tokens):
+    shifts = []
+    index, line, column = 1, 1, 1
+    for token in tokens:
+        for cursor in (token.position, token.end):
+            index_delta, line_delta, offset = cursor.distance
+            index += index_delta
+            line += line_delta
+            column = offset if line_delta else column + offset
+            slot_index.__set__(cursor, index)
+            slot_line.__set__(cursor, line)
+            slot_column.__set__(cursor, column)
+            cursor.shifts, cursor.version = shifts, 0
+    return shifts
+
+# A parsed text that can be reparsed after edits
+class Document:
+    def __init__(self, language: Language, text: str, tokens, cache: IncrementalCache, result, open_tokens, shifts=None):
+        self.language = language
+        self.text = text
+        self.tokens = tokens
+        self.cache = cache
+        self.result = result
+        self.open_tokens = open_tokens # The indices of the tokens, that an edit behind them might make longer (see "open_tokens")
+        self.shifts = shifts if shifts is not None else [] # How the edits move the cursors behind them (see "document_cursor")
+def parse_document(language: Language, text: str):
+    if language.scanner is None:
+        language.compile()
+    store = TokenStore(language.scanner, read_chunks(text))
+    while store.fill():
+        pass
+    return parse_document_tokens(language, text, store.slice(0, len(store.type_ids)))
+def parse_document_tokens(language: Language, text: str, tokens, cache: IncrementalCache=None, open_indices=None, shifts=None):
+    if shifts is None: # The tokens of a new document
+        shifts = []
+        track_cursors(tokens, shifts, input_cursor())
+    buffer = TrackingBuffer(tokens)
+    if cache is None:
+        cache = IncrementalCache(buffer)
+    cache.buffer, cache.language, cache.profiler = buffer, language, language.profiler
+    cache.pending.clear() # Left over, if the previous parse raised an exception
+    if open_indices is None:
+        open_indices = open_tokens(language.scanner, text, tokens)
+    return Document(language, text, tokens, cache, parse_tokens(language, buffer, cache, language.profiler), open_indices, shifts)
+
+# The indices (from "offset" on) of the tokens, where a token type listed before their own, that has unbounded tokens,
+# could match as well (e.g. a quote, that doesn't start a string, since it isn't terminated). Only these tokens might
+# be tokenized differently, when the text far behind them is edited.
+def open_tokens(scanner, text: str, tokens, offset=0):
+    kinds = {token_type: kind for kind, token_type in enumerate(scanner.token_types) if token_type is not None}
+    return [offset + number for number, token in enumerate(tokens) if scanner.may_continue(text[token.position.index - 1], kinds[token.type])]
+
+# Reparses a document after replacing the characters "start" to "end" with "replacement".
+# Only the changed region is tokenized again and all rule outcomes that don't depend on it are reused.
+# Note: The previous document must not be used anymore afterwards, since its tokens are reused (and shifted).
+def reparse(document: Document, edit):
+    start, end, replacement = edit
+    language, tokens, shifts = document.language, document.tokens, document.shifts
+    if not 0 <= start <= end <= len(document.text):
+        raise Exception("The edit (%d, %d) is outside of the document." % (start, end))
+    text = document.text[:start] + replacement + document.text[end:]
+    delta = len(replacement) - (end - start)
+
+    # Tokenize again from the first token touching the edit
+    first, last = 0, len(tokens)
+    while first < last:
+        middle = (first + last) // 2
+        if tokens[middle].end.index - 1 < start:
+            first = middle + 1
+        else:
+            last = middle
+
+    # ...or from an earlier token, if it is tokenized differently now (token patterns may look behind the end of their match)
+    scanner = language.scanner
+    for index in range(first - 1, -1, -1):
+        token = tokens[index]
+        kind, match = scanner.match(text, token.position.index - 1)
+        if match is not None and match.end() == token.end.index - 1 and scanner.token_types[kind] is token.type:
+            break
+        first = index
+
+    # ...or from the first open token, that an earlier listed token type could match up to the edit now
+    kinds = {token_type: kind for kind, token_type in enumerate(scanner.token_types) if token_type is not None}
+    for index in document.open_tokens:
+        if index >= first:
+            break
+        if scanner.continues(text, tokens[index].position.index - 1, kinds[tokens[index].type], start):
+            first = index
+            break
+    restart = tokens[first - 1].end if first > 0 else input_cursor()
+    restart = input_cursor(restart.index, restart.line, restart.column)
+    chunks = (text[offset:offset + 65536] for offset in range(restart.index - 1, len(text), 65536))
+    store = TokenStore(language.scanner, chunks, start=restart)
+
+    # ...until the tokenizer arrives at the end of an old token behind the edit (from there on, all tokens are the same)
+    new_tokens, old = [], first
+    while (token := store.get(len(new_tokens))) is not None:
+        new_tokens.append(token)
+        token_end = token.end.index - 1
+        while old < len(tokens) and tokens[old].end.index - 1 + delta < token_end:
+            old += 1
+        if old < len(tokens) and tokens[old].end.index - 1 + delta == token_end and tokens[old].position.index - 1 >= end:
+            break
+    else:
+        old = len(tokens) - 1
+
+    # Move the old tokens behind the edit, once their positions are used (see "document_cursor")
+    if old + 1 < len(tokens):
+        sync = tokens[old].end
+        shifts.append((sync.index, delta, sync.line, token.end.line - sync.line, token.end.column - sync.column))
+    track_cursors(new_tokens, shifts, restart)
+
+    # Reuse the outcomes of all rule references that don't depend on the changed tokens
+    document.cache.splice(first, old + 1, len(new_tokens))
+    shift = first + len(new_tokens) - (old + 1)
+    open_indices = document.open_tokens
+    low, high = bisect_left(open_indices, first), bisect_right(open_indices, old)
+    if shift:
+        for number in range(high, len(open_indices)):
+            open_indices[number] += shift
+    open_indices[low:high] = open_tokens(scanner, text, new_tokens, first)
+    tokens[first:old + 1] = new_tokens
+    if len(shifts) > len(tokens): # Rather than keeping more shifts than tokens
+        shifts = rebase(tokens)
+    return parse_document_tokens(language, text, tokens, document.cache, open_indices, shifts)
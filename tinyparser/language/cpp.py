@@ -1,4 +1,4 @@
-from .. import Token, Language, AST
+from .. import Token, Language, AST, OperatorTable
 
 # C++
 class Program(AST): pass
@@ -10,6 +10,13 @@ class UnaryOperation(AST): pass
 class MemberAccess(AST): pass
 class Literal(AST): pass
 class Identifier(AST): pass
+# Operators (shared by the operator tables below)
+sums = [( "right" , [Token.PLUS, Token.MINUS] , 1 , BinaryOperation )]
+products = [( "right" , [Token.TIMES, Token.DIVIDES] , 2 , BinaryOperation )]
+unary_operations = [
+    ( "prefix" , [Token.MINUS, Token.PLUS, Token.DOUBLE_PLUS, Token.DOUBLE_MINUS] , 3 , UnaryOperation )
+    , ( "postfix" , [Token.DOUBLE_PLUS, Token.DOUBLE_MINUS] , 4 , UnaryOperation )
+]
 cpp_grammar = {
     # Statement Blocks
     "0.1": ( Program , ("10.", "statements") , ("1.", "statements") ),
@@ -24,13 +31,9 @@ cpp_grammar = {
     "10.3": ( ExpressionStatement , ("20.", "expression") , Token.SEMICOLON ),
 
     # Expression
-    "20.1": ( BinaryOperation , ("21.", "left") , ([Token.PLUS, Token.MINUS], "type") , ("20.", "right") ),
-    "20.2": ( None , "21." ),
-    "21.1": ( BinaryOperation , ("22.", "left") , ([Token.TIMES, Token.DIVIDES], "type") , ("21.", "right") ),
-    "21.2": ( None , "22." ),
-    "22.1": ( UnaryOperation , ([Token.MINUS, Token.PLUS, Token.DOUBLE_PLUS, Token.DOUBLE_MINUS], "type") , ("22.", "operand") ),
-    "22.2": ( UnaryOperation , ("23.", "operand"), ([Token.DOUBLE_PLUS, Token.DOUBLE_MINUS], "type") ),
-    "22.3": ( None , "23." ),
+    "20.1": OperatorTable( "23." , *sums , *products , *unary_operations ),
+    "21.1": OperatorTable( "23." , *products , *unary_operations ), # Former precedence levels, which other grammars may reference
+    "22.1": OperatorTable( "23." , *unary_operations ),
     "23.1": ( None , Token.LEFT_PARENTHESIS , "20." , Token.RIGHT_PARENTHESIS ),
     "23.2": ( None , "24." ),
     "24.1": ( Literal , (Token.NUMBER, ("value", "value")) ),
@@ -0,0 +1,69 @@
+from time import perf_counter
+
+# Records, how often each rule is attempted and how long matching it takes.
+# Pass an instance to "parse" (or set "Language.profiler") to enable it.
+class Profiler:
+    def __init__(self):
+        self.rules = {} # Rule key -> [attempts, successes, failures, consumed tokens, time, own time]
+        self.tokens = {} # Token type -> [count, time]
+        self.stacks = {} # Stack of rule keys (as string separated by ";") -> own time
+        self.stack = [] # Rule attempts in progress: [key, stack, start time, time spent in nested attempts]
+        self.active = {} # Rule key -> number of attempts of that rule in progress (to not count recursive time twice)
+
+    # Parser Hooks
+    def enter(self, key):
+        stack = self.stack[-1][1] + ";" + key if self.stack else key
+        self.active[key] = self.active.get(key, 0) + 1
+        self.stack.append([key, stack, perf_counter(), 0.0])
+    def exit(self, success, consumed=0):
+        key, stack, start, nested = self.stack.pop()
+        time = perf_counter() - start
+        if self.stack:
+            self.stack[-1][3] += time
+        statistics = self.rules.get(key, None)
+        if statistics is None:
+            statistics = self.rules[key] = [0, 0, 0, 0, 0.0, 0.0]
+        statistics[0] += 1
+        statistics[1 if success else 2] += 1
+        statistics[3] += consumed
+        self.active[key] -= 1
+        if not self.active[key]: # Only the outermost attempt of recursive rules counts
+            statistics[4] += time
+        statistics[5] += time - nested
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + time - nested
+    def abort(self):
+        # Called after every parse: drops the attempts that didn't exit, because the parse raised an exception
+        self.stack.clear()
+        self.active.clear()
+
+    # Tokenizer Hooks
+    def token(self, token_type, time):
+        statistics = self.tokens.get(token_type, None)
+        if statistics is None:
+            statistics = self.tokens[token_type] = [0, 0.0]
+        statistics[0] += 1
+        statistics[1] += time
+
+    # Export
+    def as_dict(self):
+        return {
+            "rules": {
+                key: {
+                    "attempts": attempts, "successes": successes, "failures": failures
+                    , "consumed_tokens": consumed, "time": time, "own_time": own_time
+                }
+                for key, (attempts, successes, failures, consumed, time, own_time) in self.rules.items()
+            }
+            , "tokens": {
+                token_type.name: {"count": count, "time": time}
+                for token_type, (count, time) in self.tokens.items()
+            }
+        }
+    def write_collapsed(self, file):
+        # Flame graph compatible: one line per stack of rule keys with its own time in microseconds
+        for stack, time in self.stacks.items():
+            file.write("%s %d\n" % (stack.replace(" ", "_"), round(time * 1e6)))
+        for token_type, (count, time) in self.tokens.items():
+            file.write("tokenize;%s %d\n" % (token_type.name, round(time * 1e6)))
+    def clear(self):
+        self.__init__()
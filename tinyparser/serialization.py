@@ -0,0 +1,267 @@
+from types import MappingProxyType
+import json, sys
+from . import AST, InputToken, TokenType, TokenSpan, input_cursor
+
+# Serialization
+# Writes results (AST objects, lists, dictionaries, tokens and plain values) to a file object, without recursing per
+# nesting level and buffered into few writes. There are two formats:
+# - "text": the human readable format of "print_ast"
+# - "json": one JSON value per line, in the order of a depth-first walk, which "read_ast" loads again.
+#   Scalars are written as they are, everything else as an array starting with its kind:
+#   ["class", number, module, name] and ["type", number, module, name, member] define the classes of AST objects
+#   and the token types once, ["ast", class number, [attributes]], ["list", length], ["tuple", length] and
+#   ["dict", [keys]] are followed by their items and ["ref", number] repeats the AST object, list or dictionary with
+#   that number (counted in the order they are written). ["token", type number, value, verbatim, whitespaces before,
+#   start index, line, column, end index, line, column, named groups] is a token, which is numbered separately and
+#   repeated as ["tok", number]. Lists of tokens that were all written before (like "input_tokens", also if they are
+#   a "TokenSpan", which is loaded as a list) are written as
+#   ["tokens", [first number, count, first number, count, ...]] with runs of consecutively numbered tokens.
+#   Other values raise a TypeError.
+def write_ast(value, file=None, format="text", indent=None):
+    file = file or sys.stdout
+    parts = []
+    def write(text):
+        parts.append(text)
+        if len(parts) >= 4096:
+            file.write("".join(parts))
+            parts.clear()
+    if format == "text":
+        write_text(value, write, indent)
+    elif format == "json":
+        write_json(value, write)
+    else:
+        raise ValueError("Unknown AST format '%s'" % format)
+    file.write("".join(parts))
+
+closing = object() # Marks text to write as it is on the stack of "write_text"
+def write_text(value, write, indent=None):
+    if not indent:
+        write("<root> = ")
+        indent = 0
+    stack = [("", value, indent)] # (text to write first, value, indent)
+    while stack:
+        text, value, indent = stack.pop()
+        write(text)
+        if value is closing:
+            continue
+        if isinstance(value, InputToken):
+            write("[" + str(value.type) + "] = '" + value.value + "'\n")
+        elif isinstance(value, AST):
+            if type(value) != AST:
+                if hasattr(value, "grammar_rule"):
+                    write(value.__class__.__name__ + " <- [" + value.grammar_rule[1] + '] <- "' + value.grammar_rule[0] + '"\n')
+                else:
+                    write(value.__class__.__name__ + "\n")
+            elif hasattr(value, "grammar_rule"):
+                if value.grammar_rule[0] == value.grammar_rule[1]:
+                    write('[' + value.grammar_rule[0] + ']\n')
+                else:
+                    write('[' + value.grammar_rule[0] + ' > ' + value.grammar_rule[1] + ']\n')
+            else:
+                write("Abstract Syntax Tree\n")
+            attributes = []
+            for attribute, item in vars(value).items():
+                if attribute == "grammar_rule":
+                    continue
+                text = "    "*indent + "    ." + attribute + " = "
+                if attribute == "input_tokens" and item:
+                    attributes.append((text + "from (%d:%d) to (%d:%d)\n" % (
+                        item[0].position.line
+                        , item[0].position.column
+                        , item[-1].end.line
+                        , item[-1].end.column
+                    ), closing, None))
+                else:
+                    attributes.append((text, item, indent + 1))
+            stack.extend(reversed(attributes))
+        elif value == []:
+            write("[]\n")
+        elif isinstance(value, list):
+            write("[\n")
+            stack.append(("    "*indent + "]\n", closing, None))
+            stack.extend(reversed([("    "*indent + "    ." + str(number) + " = ", item, indent + 1) for number, item in enumerate(value, 1)]))
+        elif isinstance(value, str):
+            write('"%s"\n' % value)
+        else:
+            write(str(value) + "\n")
+
+def write_json(value, write):
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    classes = {} # Class -> number
+    types = {} # Token type -> number
+    objects = {} # id() of an AST object, list or dictionary -> number
+    tokens = {} # id() of a token -> number
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if value is None or kind in (str, int, float, bool):
+            write(dumps(value) + "\n")
+            continue
+        number = objects.get(id(value), None)
+        if number is not None:
+            write('["ref",%d]\n' % number)
+            continue
+        number = tokens.get(id(value), None)
+        if number is not None:
+            write('["tok",%d]\n' % number)
+            continue
+        if isinstance(value, AST):
+            if kind not in classes:
+                classes[kind] = len(classes)
+                write(dumps(["class", classes[kind], kind.__module__, kind.__qualname__]) + "\n")
+            attributes = vars(value)
+            write(dumps(["ast", classes[kind], list(attributes)]) + "\n")
+            stack.extend(reversed(attributes.values()))
+        elif kind is list or kind is TokenSpan:
+            runs = token_runs(value, tokens)
+            if runs is not None:
+                write('["tokens",%s]\n' % dumps(runs))
+            else:
+                write('["list",%d]\n' % len(value))
+                stack.extend(reversed(value))
+        elif kind is tuple:
+            write('["tuple",%d]\n' % len(value))
+            stack.extend(reversed(value))
+            continue # Tuples are written again, where they are repeated
+        elif (kind is dict or kind is MappingProxyType) and all(key is None or type(key) in (str, int, float, bool) for key in value):
+            write(dumps(["dict", list(value)]) + "\n")
+            stack.extend(reversed(value.values()))
+        elif isinstance(value, InputToken) and isinstance(value.position, input_cursor) and isinstance(value.end, input_cursor):
+            token_type = value.type
+            if token_type not in types:
+                types[token_type] = len(types)
+                token_class = type(token_type)
+                write(dumps(["type", types[token_type], token_class.__module__, token_class.__qualname__, token_type.name]) + "\n")
+            position, end = value.position, value.end
+            write(dumps([
+                "token", types[token_type], value.value, value.verbatim, value.space_before
+                , position.index, position.line, position.column, end.index, end.line, end.column
+                , None if value.groups is None else dict(value.groups)
+            ]) + "\n")
+            tokens[id(value)] = len(tokens)
+            continue
+        else:
+            raise TypeError("Cannot write a value of type %s in the json AST format" % kind.__qualname__)
+        objects[id(value)] = len(objects)
+
+# Returns the runs of consecutive numbers "[first, count, ...]" of a list of tokens, or None, if it contains anything else
+def token_runs(values, tokens):
+    if not values:
+        return None
+    runs = []
+    for value in values:
+        number = tokens.get(id(value), None)
+        if number is None or not isinstance(value, InputToken):
+            return None
+        if runs and runs[-2] + runs[-1] == number:
+            runs[-1] += 1
+        else:
+            runs += [number, 1]
+    return runs
+
+# Loads a result written by "write_ast" in the "json" format with "language".
+# The classes of AST objects and token types are only looked up in the modules, that define the targets and the token
+# class of "language" (or "tinyparser" itself), and must derive from "AST" and "TokenType". Nothing is imported.
+def read_ast(file, language):
+    loads = json.JSONDecoder().decode
+    modules = language_modules(language)
+    classes = {} # Number -> class
+    types = {} # Number -> token type
+    objects = [] # AST objects, lists and dictionaries in the order they were written
+    tokens = [] # Tokens in the order they were written
+    stack = [] # Values whose items are still being read: [value, keys (or None for lists and tuples), count of items read]
+    root = []
+    for line in file:
+        record = loads(line)
+        if type(record) is list:
+            kind = record[0]
+            if kind == "class":
+                classes[record[1]] = find_class(modules, record[2], record[3], AST)
+                continue
+            elif kind == "type":
+                types[record[1]] = find_class(modules, record[2], record[3], TokenType)[record[4]]
+                continue
+            elif kind == "ref":
+                value = objects[record[1]]
+            elif kind == "tok":
+                value = tokens[record[1]]
+            elif kind == "tokens":
+                runs = record[1]
+                value = []
+                for index in range(0, len(runs), 2):
+                    value += tokens[runs[index]:runs[index] + runs[index + 1]]
+                objects.append(value)
+            elif kind == "ast":
+                value = object.__new__(classes[record[1]])
+                objects.append(value)
+                if record[2]:
+                    stack.append([value, record[2], 0])
+                    continue
+            elif kind == "list" or kind == "tuple":
+                value = []
+                if kind == "list":
+                    objects.append(value)
+                if record[1]:
+                    stack.append([value, None, record[1], kind])
+                    continue
+                value = value if kind == "list" else ()
+            elif kind == "dict":
+                value = {}
+                objects.append(value)
+                if record[1]:
+                    stack.append([value, record[1], 0])
+                    continue
+            elif kind == "token":
+                value = InputToken(types[record[1]], record[2], record[4], input_cursor(*record[5:8]), input_cursor(*record[8:11]))
+                value.verbatim, value.groups = record[3], record[11]
+                tokens.append(value)
+            else:
+                raise ValueError("Unknown record in AST file: %s" % line)
+        else:
+            value = record
+
+        # Add the value to the innermost unfinished value (and finish it, if that was its last item)
+        while stack:
+            entry = stack[-1]
+            container, keys = entry[0], entry[1]
+            if keys is None: # A list or tuple
+                container.append(value)
+                if len(container) < entry[2]:
+                    break
+                stack.pop()
+                value = container if entry[3] == "list" else tuple(container)
+            else:
+                if isinstance(container, dict):
+                    container[keys[entry[2]]] = value
+                else:
+                    vars(container)[keys[entry[2]]] = value
+                entry[2] += 1
+                if entry[2] < len(keys):
+                    break
+                stack.pop()
+                value = container
+        else:
+            root.append(value)
+    if stack or len(root) != 1:
+        raise ValueError("The AST file is incomplete")
+    return root[0]
+
+# Returns the names of the modules, whose classes can be in the results of "language"
+def language_modules(language):
+    if language.compiled_rules is None:
+        language.compile()
+    targets = [language.token_class, AST]
+    for rule in language.compiled_rules.values():
+        targets.append(rule.target)
+        if rule.operators is not None:
+            targets += [operator.rule.target for operators in rule.operators.values() for operator in operators]
+    return {target.__module__ for target in targets if isinstance(getattr(target, "__module__", None), str)}
+
+def find_class(modules, module, name, base):
+    value = sys.modules.get(module) if module in modules else None
+    for part in name.split("."):
+        value = getattr(value, part, None)
+    if not isinstance(value, type) or not issubclass(value, base):
+        raise ValueError("Unknown class in AST file: %s.%s" % (module, name))
+    return value